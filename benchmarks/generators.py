@@ -0,0 +1,205 @@
+"""Synthetic stock databases and KiCad netlists for the benchmarks.
+
+Everything is generated from a seeded `random.Random`, so the same sizes
+always give the same data and timings stay comparable between runs.
+"""
+import random
+
+E12 = (1.0, 1.2, 1.5, 1.8, 2.2, 2.7, 3.3, 3.9, 4.7, 5.6, 6.8, 8.2)
+E24 = (1.0, 1.1, 1.2, 1.3, 1.5, 1.6, 1.8, 2.0, 2.2, 2.4, 2.7, 3.0,
+       3.3, 3.6, 3.9, 4.3, 4.7, 5.1, 5.6, 6.2, 6.8, 7.5, 8.2, 9.1)
+
+PASSIVE_PACKAGES = ('0402', '0603', '0805', '1206')
+IC_PACKAGES = ('SOIC-8', 'SOIC-14', 'TSSOP-20', 'LQFP-48', 'QFN-32', 'SOT-23-5')
+IC_FAMILIES = (('STM32F4', 'ST'), ('STM32G0', 'ST'), ('ATMEGA', 'Microchip'), ('LM', 'TI'),
+               ('TPS', 'TI'), ('AD', 'Analog'), ('MAX', 'Analog'), ('NE', 'TI'))
+
+FORMATS = {
+    'Resistors': 'Value,Tolerance,Wattage,Package,Qty',
+    'Capacitors': 'Value,Voltage,Dielectric,Package,Qty',
+    'ICs': 'Name,Manufacturer,Package,Qty',
+}
+
+# KiCad footprints, each containing the package name the converter looks for
+FOOTPRINTS = {
+    '0402': 'R_0402_1005Metric', '0603': 'R_0603_1608Metric',
+    '0805': 'R_0805_2012Metric', '1206': 'R_1206_3216Metric',
+    'SOIC-8': 'SOIC-8_3.9x4.9mm_P1.27mm', 'SOIC-14': 'SOIC-14_3.9x8.7mm_P1.27mm',
+    'TSSOP-20': 'TSSOP-20_4.4x6.5mm_P0.65mm', 'LQFP-48': 'LQFP-48_7x7mm_P0.5mm',
+    'QFN-32': 'QFN-32-1EP_5x5mm_P0.5mm', 'SOT-23-5': 'SOT-23-5',
+}
+
+
+def format_value(value, units):
+    """Format an absolute value with the largest fitting unit letter: 4700 -> 4.7k"""
+    for letter, multiplier in units:
+        if value >= multiplier:
+            value = value / multiplier
+            text = f'{value:.2f}'.rstrip('0').rstrip('.')
+            return text + letter
+    return f'{value:g}'
+
+
+_RESISTANCE = (('M', 1000000), ('k', 1000), ('', 1))
+_CAPACITANCE = (('u', 1000000), ('n', 1000), ('p', 1))
+
+
+def resistor_keys():
+    for package in PASSIVE_PACKAGES:
+        for wattage in ('0.1W', '0.125W', '0.25W'):
+            for tolerance in ('1%', '5%'):
+                for decade in range(7):
+                    for mantissa in E24:
+                        value = format_value(round(mantissa * 10 ** decade, 2), _RESISTANCE)
+                        yield [value, tolerance, wattage, package]
+
+
+def capacitor_keys():
+    for package in PASSIVE_PACKAGES:
+        for dielectric in ('C0G', 'X5R', 'X7R'):
+            for voltage in ('10V', '16V', '25V', '50V', '100V'):
+                for decade in range(8):
+                    for mantissa in E12:
+                        value = format_value(round(mantissa * 10 ** decade, 2), _CAPACITANCE)
+                        yield [value, voltage, dielectric, package]
+
+
+def ic_keys():
+    i = 0
+    while True:
+        family, manufacturer = IC_FAMILIES[i % len(IC_FAMILIES)]
+        yield [f'{family}{i:06d}', manufacturer, IC_PACKAGES[i % len(IC_PACKAGES)]]
+        i += 1
+
+
+def generate_stock(n_rows, seed=0):
+    """Return {category: [component rows]} with n_rows unique components in total.
+    Passives take up to 40% each (their key space is finite), ICs fill the rest.
+    """
+    rng = random.Random(seed)
+    resistors = list(resistor_keys())
+    capacitors = list(capacitor_keys())
+    rng.shuffle(resistors)
+    rng.shuffle(capacitors)
+    n_resistors = min(len(resistors), n_rows * 2 // 5)
+    n_capacitors = min(len(capacitors), n_rows * 2 // 5)
+    ics = ic_keys()
+
+    stock = {
+        'Resistors': resistors[:n_resistors],
+        'Capacitors': capacitors[:n_capacitors],
+        'ICs': [next(ics) for _ in range(n_rows - n_resistors - n_capacitors)],
+    }
+    for rows in stock.values():
+        for row in rows:
+            row.append(rng.choice((1, 5, 10, 25, 50, 100, 500, 1000, 4000)))
+    return stock
+
+
+def stock_to_csv_lines(stock):
+    """Lines in the format Database.load_from_csv() reads."""
+    lines = []
+    for cat_name, rows in stock.items():
+        if not rows:
+            continue
+        lines.append(f'{cat_name}\n')
+        lines.append(f'{FORMATS[cat_name]}\n')
+        lines.extend(','.join(map(str, row)) + '\n' for row in rows)
+    return lines
+
+
+def write_stock_csv(path, n_rows, seed=0):
+    with open(path, 'w') as f:
+        f.writelines(stock_to_csv_lines(generate_stock(n_rows, seed)))
+
+
+def generate_project(stock, n_rows, missing_ratio=0.1, seed=1):
+    """Return a project BOM {category: [rows]} sampled from the stock.
+    About missing_ratio of the rows are not in stock at all, the others need
+    between 1 and twice the stocked quantity.
+    """
+    rng = random.Random(seed)
+    all_rows = [(cat_name, row) for cat_name, rows in stock.items() for row in rows]
+    project = {cat_name: [] for cat_name in stock}
+    missing = ic_keys()
+    for _ in range(n_rows):
+        if not all_rows:
+            break
+        cat_name, row = all_rows.pop(rng.randrange(len(all_rows)))
+        stock_qty = row[-1]
+        row = row[:-1]
+        if rng.random() < missing_ratio:
+            if cat_name == 'ICs':
+                row = [f'MISSING{next(missing)[0]}'] + row[1:]
+            else:
+                row[-1] = 'TH'  # a package that is never stocked
+        row.append(rng.randint(1, 2 * stock_qty))
+        project[cat_name].append(row)
+    return project
+
+
+def _netlist_value(cat_name, row):
+    """KiCad Value field as the converter expects it: 10k/1%/0.25W, 100n/50V/X7R"""
+    if cat_name == 'ICs':
+        return row[0]
+    return '/'.join(row[:-2])
+
+
+def _netlist_footprint(cat_name, package):
+    if cat_name == 'Resistors':
+        return f'Resistor_SMD:{FOOTPRINTS.get(package, package)}'
+    if cat_name == 'Capacitors':
+        return f'Capacitor_SMD:{FOOTPRINTS.get(package, package).replace("R_", "C_")}'
+    return f'Package:{FOOTPRINTS.get(package, package)}'
+
+
+_REF_PREFIXES = {'Resistors': 'R', 'Capacitors': 'C', 'ICs': 'U'}
+_LIBPARTS = {'Resistors': ('Device', 'R'), 'Capacitors': ('Device', 'C'), 'ICs': ('Synthetic', 'IC')}
+
+
+def write_netlist_xml(path, stock, n_components, seed=2):
+    """Write a KiCad XML netlist with n_components placed from the stock parts."""
+    rng = random.Random(seed)
+    parts = [(cat_name, row) for cat_name, rows in stock.items() for row in rows]
+    counters = {cat_name: 0 for cat_name in _REF_PREFIXES}
+    refs = []
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n<export version="E">\n')
+        f.write('  <design>\n    <source>synthetic.kicad_sch</source>\n'
+                '    <tool>Eeschema 7.0.0</tool>\n  </design>\n  <components>\n')
+        for i in range(n_components):
+            cat_name, row = rng.choice(parts)
+            counters[cat_name] += 1
+            ref = f'{_REF_PREFIXES[cat_name]}{counters[cat_name]}'
+            refs.append(ref)
+            lib, part = _LIBPARTS[cat_name]
+            f.write(f'    <comp ref="{ref}">\n'
+                    f'      <value>{_netlist_value(cat_name, row)}</value>\n'
+                    f'      <footprint>{_netlist_footprint(cat_name, row[-2])}</footprint>\n'
+                    f'      <datasheet>~</datasheet>\n'
+                    f'      <libsource lib="{lib}" part="{part}" description="{part} part"/>\n'
+                    f'      <property name="Sheetname" value=""/>\n'
+                    f'      <property name="Sheetfile" value="synthetic.kicad_sch"/>\n'
+                    f'      <sheetpath names="/" tstamps="/"/>\n'
+                    f'      <tstamps>{i:08x}-0000-0000-0000-000000000000</tstamps>\n'
+                    f'    </comp>\n')
+        f.write('  </components>\n  <libparts>\n')
+        for prefix, (lib, part) in zip(_REF_PREFIXES.values(), _LIBPARTS.values()):
+            f.write(f'    <libpart lib="{lib}" part="{part}">\n'
+                    f'      <description>{part} part</description>\n'
+                    f'      <fields>\n'
+                    f'        <field name="Reference">{prefix}</field>\n'
+                    f'        <field name="Value">{part}</field>\n'
+                    f'      </fields>\n'
+                    f'      <pins>\n'
+                    f'        <pin num="1" name="~" type="passive"/>\n'
+                    f'        <pin num="2" name="~" type="passive"/>\n'
+                    f'      </pins>\n'
+                    f'    </libpart>\n')
+        f.write('  </libparts>\n  <nets>\n')
+        for i in range(0, len(refs) - 1, 2):
+            f.write(f'    <net code="{i // 2 + 1}" name="N{i // 2}">\n'
+                    f'      <node ref="{refs[i]}" pin="1" pintype="passive"/>\n'
+                    f'      <node ref="{refs[i + 1]}" pin="2" pintype="passive"/>\n'
+                    f'    </net>\n')
+        f.write('  </nets>\n</export>\n')
@@ -0,0 +1,99 @@
+"""Compare the SAX XML netlist reader with the native S-expression reader.
+
+Usage: python benchmarks/netlist_formats.py [DESIGN.xml] [-n COMPONENTS] [-r REPEAT] [--memory]
+
+The S-expression file is produced from the XML design, so both readers parse
+exactly the same netlist. Without DESIGN a synthetic one is generated.
+Each reader is run with the original `xmlElement` tree and with the compact
+one; --memory also reports the peak traced memory of every load.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from thirdparty import kicad_netlist_reader
+import netlist_reader
+import generators
+
+
+def best_time(load, path, repeat):
+    best = None
+    net = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        net = load(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, net
+
+
+def peak_memory(load, path):
+    tracemalloc.start()
+    try:
+        load(path)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def component_summary(net):
+    return [(c.getRef(), c.getValue(), c.getFootprint(), c.getPartName())
+            for c in net.getInterestingComponents(excludeBOM=True)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('design', nargs='?', help='KiCad XML netlist')
+    parser.add_argument('-n', '--components', type=int, default=5000,
+                        help='size of the synthetic design (default: 5000)')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--memory', action='store_true', help='measure peak memory with tracemalloc')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_path = args.design
+        if xml_path is None:
+            xml_path = os.path.join(tmp, 'design.xml')
+            stock = generators.generate_stock(5000)
+            generators.write_netlist_xml(xml_path, stock, args.components)
+        sexpr_path = os.path.join(tmp, 'design.net')
+        with open(sexpr_path, 'w', encoding='utf-8') as f:
+            f.write(netlist_reader.format_sexpr(kicad_netlist_reader.netlist(xml_path).tree))
+
+        readers = [
+            ('XML (SAX)', kicad_netlist_reader.netlist, xml_path),
+            ('XML (SAX), compact', netlist_reader.CompactNetlist, xml_path),
+            ('S-expression', lambda path: netlist_reader.SexprNetlist(path, compact=False), sexpr_path),
+            ('S-expression, compact', netlist_reader.SexprNetlist, sexpr_path),
+        ]
+        results = []
+        for title, load, path in readers:
+            elapsed, net = best_time(load, path, args.repeat)
+            peak = peak_memory(load, path) if args.memory else None
+            results.append((title, elapsed, peak, net))
+
+        expected = component_summary(results[0][3])
+        for title, elapsed, peak, net in results[1:]:
+            if component_summary(net) != expected:
+                print(f'Error: {title} reader disagrees on the component list', file=sys.stderr)
+                sys.exit(1)
+
+        base_time = results[0][1]
+        print(f'Components: {len(results[0][3].components)}')
+        print(f'XML size: {os.path.getsize(xml_path)} bytes, '
+              f'S-expression size: {os.path.getsize(sexpr_path)} bytes')
+        for title, elapsed, peak, net in results:
+            line = f'{title:<24}{elapsed * 1000:9.1f} ms {base_time / elapsed:6.2f}x'
+            if peak is not None:
+                line += f'  peak {peak / 2 ** 20:8.1f} MiB'
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
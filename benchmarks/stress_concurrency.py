@@ -0,0 +1,140 @@
+"""Multi-threaded stress test of the thread-safe Database.
+
+Usage: python benchmarks/stress_concurrency.py [-n ROWS] [--readers N] [--writers N]
+                                               [--seconds S] [--unsafe]
+
+Writers keep adding and subtracting stock while readers filter, diff
+against a project, look for substitutes and dominating parts and take
+snapshots. Writers also add and remove rows, so the lazy indexes of the
+categories keep being rebuilt by concurrent readers. The run fails (exit
+status 1) if any reader hits an exception or a wrong substitute or
+dominating result, a snapshot changes after it was taken, or the final
+quantities differ from what the writers did. --unsafe runs the same
+load on a plain Database to show what the locking prevents.
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from database import Database
+import generators
+
+
+def total_quantity(db):
+    return sum(c[-1] for cat in db.categories.values() for c in cat.components)
+
+
+def keys(components):
+    return sorted(tuple(c[:-1]) for c in components)
+
+
+def substitute_keys(substitutes):
+    return [(cat_name, tuple(c[:-1]), keys(found)) for cat_name, c, found in substitutes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--rows', type=int, default=2000)
+    parser.add_argument('--readers', type=int, default=6)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--unsafe', action='store_true', help='use a Database without locking')
+    args = parser.parse_args()
+
+    stock = generators.generate_stock(args.rows)
+    lines = generators.stock_to_csv_lines(stock)
+    db = Database(thread_safe=not args.unsafe)
+    db.load_from_csv(lines)
+    project = Database()
+    project.load_from_csv(generators.stock_to_csv_lines(generators.generate_project(stock, 200)))
+    initial_total = total_quantity(db)
+    # Writers change only quantities of these rows, so the answers stay the same
+    shortage = db.calc_difference(project)
+    expected_substitutes = substitute_keys(db.find_substitutes(shortage))
+    dominating_query = {'Package': '0603', 'Tolerance': '1%', 'Wattage': '0.125W'}
+    expected_dominating = keys(db.filter_components_dominating('Resistors', **dominating_query).components)
+
+    stop = threading.Event()
+    errors = []
+    added = [0] * args.writers
+    counts = {'reads': 0, 'snapshots': 0, 'writes': 0}
+
+    def writer(index):
+        rng = random.Random(index)
+        rows = [(cat_name, ','.join(map(str, row[:-1]))) for cat_name, rows in stock.items() for row in rows]
+        temporary = f'TMP{index}'
+        try:
+            while not stop.is_set():
+                cat_name, key = rng.choice(rows)
+                db.add_component(cat_name, f'{key},3')
+                db.subtract_component(cat_name, f'{key},1')
+                added[index] += 2
+                # Short-lived rows, so rows are also appended and removed
+                db.add_component('ICs', f'{temporary},ST,SOIC-8,1')
+                db.subtract_component('ICs', f'{temporary},ST,SOIC-8,1')
+                db.add_component('Resistors', f'1k,1%,0.25W,{temporary},1')
+                db.subtract_component('Resistors', f'1k,1%,0.25W,{temporary},1')
+                counts['writes'] += 6
+        except Exception as e:
+            errors.append(f'writer {index}: {type(e).__name__}: {e}')
+
+    def reader(index):
+        rng = random.Random(1000 + index)
+        try:
+            while not stop.is_set():
+                choice = rng.random()
+                if choice < 0.3:
+                    db.filter_components('Resistors', Package=rng.choice(generators.PASSIVE_PACKAGES))
+                elif choice < 0.4:
+                    db.filter_components_from_bound('Capacitors', 'Voltage', '25V', '>=')
+                elif choice < 0.6:
+                    db.calc_difference(project)
+                elif choice < 0.7:
+                    if substitute_keys(db.find_substitutes(shortage)) != expected_substitutes:
+                        errors.append(f'reader {index}: wrong substitutes')
+                elif choice < 0.8:
+                    found = db.filter_components_dominating('Resistors', **dominating_query)
+                    if keys(found.components) != expected_dominating:
+                        errors.append(f'reader {index}: wrong dominating components')
+                else:
+                    snap = db.snapshot()
+                    before = snap.convert_to_csv()
+                    time.sleep(0.001)
+                    if snap.convert_to_csv() != before:
+                        errors.append(f'reader {index}: snapshot changed after it was taken')
+                    counts['snapshots'] += 1
+                counts['reads'] += 1
+        except Exception as e:
+            errors.append(f'reader {index}: {type(e).__name__}: {e}')
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    expected_total = initial_total + sum(added)
+    if not errors and total_quantity(db) != expected_total:
+        errors.append(f'final quantity {total_quantity(db)} != expected {expected_total}')
+
+    print(f'{counts["reads"]} reads ({counts["snapshots"]} snapshots), {counts["writes"]} writes '
+          f'in {args.seconds:g} s with {args.readers} readers and {args.writers} writers')
+    if errors:
+        print(f'FAILED: {len(errors)} errors', file=sys.stderr)
+        for e in errors[:10]:
+            print(f'  {e}', file=sys.stderr)
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""DxStock benchmark suite.
+
+Usage: python benchmarks/suite.py [--sizes N ...] [--netlist-sizes M ...] [-r REPEAT]
+                                  [--only NAME ...] [-o RESULTS.json]
+                                  [--baseline BASELINE.json] [--threshold 0.2]
+
+Times the Database operations on synthetic stocks of N rows and the full
+converter pipeline on synthetic netlists of M components. Results are
+written as JSON; with --baseline every result is compared to the saved one
+and the exit status is 1 if anything got slower than the threshold allows.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import runpy
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from category import ComponentCategory
+from database import Database
+import generators
+
+MUTATIONS = 1000
+
+
+def load_db(lines):
+    db = Database()
+    db.load_from_csv(lines)
+    return db
+
+
+def component_strs(rows):
+    return [','.join(map(str, row)) for row in rows]
+
+
+def stock_benchmarks(n_rows):
+    """Yield (name, setup, run) for a stock of n_rows. setup() is not timed,
+    its result is passed to run().
+    """
+    stock = generators.generate_stock(n_rows)
+    lines = generators.stock_to_csv_lines(stock)
+    loaded = load_db(lines)
+    project_rows = max(10, min(n_rows // 10, 1000))
+    project = load_db(generators.stock_to_csv_lines(generators.generate_project(stock, project_rows)))
+    in_stock = generators.generate_project(stock, project_rows, missing_ratio=0)
+    for rows in in_stock.values():
+        for row in rows:
+            row[-1] = 1
+    in_stock_project = load_db(generators.stock_to_csv_lines(in_stock))
+
+    existing = [(cat_name, s) for cat_name, rows in stock.items() for s in component_strs(
+        [row[:-1] + [1] for row in rows[:MUTATIONS // 2]])]
+    new_ics = [['NEW' + row[0]] + row[1:-1] + [1] for row in stock['ICs'][:MUTATIONS // 2]]
+    added = existing + [('ICs', s) for s in component_strs(new_ics)]
+
+    def fresh():
+        return load_db(lines)
+
+    def add(db):
+        for cat_name, component_str in added:
+            db.add_component(cat_name, component_str)
+
+    def subtract(db):
+        for cat_name, component_str in existing:
+            db.subtract_component(cat_name, component_str)
+
+    yield 'load_from_csv', None, lambda _: load_db(lines)
+    yield 'add', fresh, add
+    yield 'subtract', fresh, subtract
+    yield 'filter', None, lambda _: loaded.filter_components('Resistors', Package='0603')
+    yield 'filter_name_prefix', None, lambda _: loaded.filter_components('ICs', Name='STM32F4')
+    yield 'filter_limit', None, lambda _: loaded.filter_components_view(
+        'Resistors', {'Package': '0603'}, limit=20).components
+    yield 'filter_top', None, lambda _: loaded.filter_components_view(
+        'Resistors', {'Package': '0603'}, top=20).components
+    yield 'filter_from_bound', None, lambda _: loaded.filter_components_from_bound(
+        'Capacitors', 'Voltage', '50V', '>=')
+    yield 'calc_difference', None, lambda _: loaded.calc_difference(project)
+    yield 'subtract_other', fresh, lambda db: db.subtract_other(in_stock_project)
+    yield 'convert_to_csv', None, lambda _: loaded.convert_to_csv()
+    yield 'render', None, lambda _: str(loaded)
+
+
+def converter_benchmarks(n_components, tmp):
+    stock = generators.generate_stock(5000)
+    stock_path = os.path.join(tmp, 'stock.csv')
+    with open(stock_path, 'w') as f:
+        f.writelines(generators.stock_to_csv_lines(stock))
+    netlist_path = os.path.join(tmp, f'netlist_{n_components}.xml')
+    generators.write_netlist_xml(netlist_path, stock, n_components)
+    output = os.path.join(tmp, f'bom_{n_components}')
+
+    def convert(_):
+        # The converter reads the stock relative to its own directory
+        argv = sys.argv
+        sys.argv = ['converter.py', netlist_path, output, os.path.relpath(stock_path, ROOT)]
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                runpy.run_path(os.path.join(ROOT, 'converter.py'), run_name='__main__')
+        finally:
+            sys.argv = argv
+
+    yield 'converter', None, convert
+
+
+def measure(setup, run, repeat):
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run_suite(args):
+    results = []
+    # Repeated queries would only time the query cache
+    ComponentCategory.cache_size = 0
+
+    def record(name, size, setup, run):
+        if args.only and name not in args.only:
+            return
+        times = measure(setup, run, args.repeat)
+        result = {'name': name, 'size': size, 'min': min(times),
+                  'median': statistics.median(times), 'repeat': len(times)}
+        results.append(result)
+        print(f'{name:<20}{size:>9}{result["min"] * 1000:12.2f} ms', flush=True)
+
+    for n_rows in args.sizes:
+        for name, setup, run in stock_benchmarks(n_rows):
+            record(name, n_rows, setup, run)
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_components in args.netlist_sizes:
+            for name, setup, run in converter_benchmarks(n_components, tmp):
+                record(name, n_components, setup, run)
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """Print current vs baseline times, return the number of regressions."""
+    saved = {(r['name'], r['size']): r for r in baseline['results']}
+    regressions = 0
+    print(f'\n{"benchmark":<20}{"size":>9}{"baseline":>14}{"current":>14}{"ratio":>8}')
+    for result in report['results']:
+        old = saved.get((result['name'], result['size']))
+        if old is None:
+            continue
+        ratio = result['min'] / old['min'] if old['min'] else float('inf')
+        mark = ''
+        if ratio > 1 + threshold:
+            mark = '  SLOWER'
+            regressions += 1
+        elif ratio < 1 / (1 + threshold):
+            mark = '  faster'
+        print(f'{result["name"]:<20}{result["size"]:>9}{old["min"] * 1000:11.2f} ms'
+              f'{result["min"] * 1000:11.2f} ms{ratio:8.2f}{mark}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='*', default=[1000, 10000],
+                        help='stock sizes in rows (default: 1000 10000)')
+    parser.add_argument('--netlist-sizes', type=int, nargs='*', default=[100, 1000],
+                        help='netlist sizes in components (default: 100 1000)')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='*', help='run only the named benchmarks')
+    parser.add_argument('-o', '--output', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare with results saved by an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown reported as a regression (default: 0.2)')
+    args = parser.parse_args()
+
+    report = run_suite(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
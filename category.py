@@ -1,36 +1,142 @@
-from collections import deque
+import bisect
+import heapq
+import itertools
+import math
+import operator
+import threading
+from collections import OrderedDict, deque
 from tabulate import tabulate
+import instrumentation
+import values
+from trigram import TrigramIndex
 
 
 class CategoryException(Exception):
     pass
 
 
+# Values per decade of the E-series usable to restrict substitutes
+E_SERIES = {'E3': 3, 'E6': 6, 'E12': 12, 'E24': 24, 'E48': 48, 'E96': 96, 'E192': 192}
+
+# Ratings a replacement part may exceed: 1 if higher is better, -1 if lower is
+RATINGS = {'Tolerance': -1, 'Voltage': 1, 'Current': 1, 'Wattage': 1}
+
+# Generations are unique across all categories, so a copy never looks unchanged
+_generations = itertools.count(1)
+_cache_lock = threading.Lock()  # Readers of a thread-safe Database share the caches
+
+_COMPARISONS = {'=': operator.eq, '>=': operator.ge, '<=': operator.le, '>': operator.gt, '<': operator.lt}
+
+
 class ComponentCategory:
-    _MULTIPLIERS = {
-        # for resistance
-        'k': 1000,
-        'M': 1000000,
-        'G': 1000000000,
-        # for capacitance and inductance
-        'p': 1,
-        'n': 1000,
-        'u': 1000000,
-        'm': 1000000000,
-        # for other
-        'V': 1,
-        'A': 1,
-        'W': 1,
-        '%': 1
-    }
+    cache_size = 64  # Query results kept per category, 0 disables the cache
 
     def __init__(self, name: str, format_str: str, components=None):
         self.name = name
         self.format_str = format_str.strip()
         self.format = format_str.split(',')
+        # Numeric parameters are matched by value: (index, kind of values)
+        self._numeric = [(i, values.kind_of(name, p)) for i, p in enumerate(self.format[:-1])
+                         if values.kind_of(name, p) is not None]
+        self._kinds = dict(self._numeric)
         self.components = deque()
         if components is not None:
             self.components.extend(components)
+        self._index = None  # Parameters -> component, built on first lookup
+        self._value_index = None  # Package -> (sorted values, components), built by find_substitutes
+        self._rating_index = None  # (Value, Package) -> (components, rating rows), built by filter_dominating
+        self._column_indexes = {}  # (kind of index, column) -> index, built by select, then kept up to date
+        self._trigrams = None  # Built by fuzzy_search, then kept up to date by add and subtract
+        self._owned_rows = None  # ids of the rows not shared with the category forked from, see fork()
+        self.generation = next(_generations)  # Changes with every add and subtract
+        self._cache = OrderedDict()  # Query -> result, least recently used first
+        self._cache_generation = self.generation
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def copy(self):
+        """Return an independent copy of this category, its key index built."""
+        category = ComponentCategory(self.name, self.format_str, [c[:] for c in self.components])
+        category._key_index()
+        return category
+
+    def fork(self):
+        """Return a copy of this category sharing its rows and built indexes,
+        for a Database snapshot. Costs O(n) references instead of copying
+        every row; a row is copied only when the fork changes it, see _writable().
+        This category must not be changed afterwards.
+        """
+        category = ComponentCategory(self.name, self.format_str, self.components)
+        category._index = dict(self._key_index())
+        category._value_index = self._value_index  # Replaced, never changed in place
+        category._rating_index = self._rating_index
+        for key, index in self._column_indexes.items():
+            # Lists in a hash index are replaced, never changed in place
+            category._column_indexes[key] = index.copy() if key[0] == 'hash' else (index[0][:], index[1][:])
+        if self._trigrams is not None:
+            category._trigrams = self._trigrams.copy()
+        category._owned_rows = set()
+        category.generation = self.generation
+        with _cache_lock:
+            category._cache.update(self._cache)
+            category._cache_generation = self._cache_generation
+        return category
+
+    def _writable(self, components):
+        """Return components, each replaced by a copy of its own if it is
+        shared with the category this one was forked from.
+        """
+        if self._owned_rows is None:
+            return components
+        copies = {id(c): c[:] for c in components if id(c) not in self._owned_rows}
+        if copies:
+            self._replace([c for c in components if id(c) in copies], copies)
+        return [copies.get(id(c), c) for c in components]
+
+    def _replace(self, olds, copies):
+        """Put the copies ({id(row): copy}) of the rows olds in their place everywhere."""
+        olds = list({id(old): old for old in olds}.values())
+        if len(olds) == 1:
+            self.components[self.components.index(olds[0])] = copies[id(olds[0])]
+        else:
+            self.components = deque(copies.get(id(c), c) for c in self.components)
+        self._owned_rows.update(id(c) for c in copies.values())
+        for old in olds:
+            self._index[self._key(old)] = copies[id(old)]
+            if self._trigrams is not None:
+                self._trigrams.replace(old, copies[id(old)])
+
+        def swap(rows):
+            return [copies.get(id(c), c) for c in rows]
+
+        value_idx = self.format.index('Value') if 'Value' in self.format else None
+        package_idx = self.format.index('Package') if 'Package' in self.format else None
+        if self._value_index is not None:
+            index = dict(self._value_index)
+            for package in {old[package_idx] if package_idx is not None else None for old in olds} & index.keys():
+                index[package] = (index[package][0], swap(index[package][1]))
+            self._value_index = index
+        if self._rating_index is not None:
+            index = dict(self._rating_index)
+            groups = {(self._value_key(old[value_idx]) if value_idx is not None else None,
+                       old[package_idx] if package_idx is not None else None) for old in olds}
+            for group in groups & index.keys():
+                index[group] = (swap(index[group][0]), index[group][1])
+            self._rating_index = index
+        for (kind, idx), index in self._column_indexes.items():
+            if kind == 'hash':
+                for value in {self._canonical(idx, old[idx]) for old in olds}:
+                    index[value] = swap(index[value])
+            else:
+                keys, rows = index
+                for old in olds:
+                    key = self._number(old[idx], self.format[idx]) if kind == 'number' else old[idx]
+                    if key is None:
+                        continue
+                    i = bisect.bisect_left(keys, key)
+                    while rows[i] is not old:
+                        i += 1
+                    rows[i] = copies[id(old)]
 
     def _str_to_component(self, component_str):
         component_str = component_str.strip()
@@ -41,39 +147,147 @@ class ComponentCategory:
             raise CategoryException(f'Incorrect format: {component_str}, expected: {self.format}')
         return component
 
+    def _key(self, component):
+        """Hashable identity of a component: all parameters but quantity,
+        numeric ones by value, so 4k7, 4.7k and 4700 are the same resistor.
+        """
+        key = component[:-1]
+        for i, kind in self._numeric:
+            try:
+                key[i] = values.parse(key[i], kind)
+            except ValueError:
+                pass  # Not a number, matched as is
+        return tuple(key)
+
+    def _key_index(self):
+        if self._index is None:
+            # Published only once complete, readers of a thread-safe Database may race here
+            index = {}
+            for c in self.components:
+                index.setdefault(self._key(c), c)
+            self._index = index
+            if instrumentation.enabled:
+                instrumentation.count('find: rows scanned', len(self.components))
+        return self._index
+
     def find(self, component):
-        for existing_component in self.components:
-            for i in range(len(existing_component) - 1):
-                if component[i] != existing_component[i]:
-                    break
-            else:  # Entry match
-                return existing_component
-        else:
-            return None
+        if instrumentation.enabled:
+            instrumentation.count('find: calls')
+        return self._key_index().get(self._key(component))
+
+    def _rows_added(self, components):
+        """Add new rows to the column indexes, drop the value and rating indexes."""
+        self._value_index = None
+        self._rating_index = None
+        for (kind, idx), index in self._column_indexes.items():
+            if kind == 'hash':
+                groups = {}
+                for c in components:
+                    groups.setdefault(self._canonical(idx, c[idx]), []).append(c)
+                for value, rows in groups.items():
+                    index[value] = index.get(value, []) + rows  # Lists may be shared with a fork
+                continue
+            keys, rows = index
+            new = self._column_rows(kind, idx, components)
+            if len(new) == 1:
+                (key, c), = new
+                i = bisect.bisect_right(keys, key)
+                keys.insert(i, key)
+                rows.insert(i, c)
+            elif new:
+                # Both runs are sorted already, which the sort takes advantage of
+                merged = list(zip(keys, rows)) + new
+                merged.sort(key=lambda row: row[0])
+                keys[:] = [key for key, c in merged]
+                rows[:] = [c for key, c in merged]
+
+    def _rows_removed(self, components):
+        """Remove rows from the column indexes, drop the value and rating indexes."""
+        self._value_index = None
+        self._rating_index = None
+        removed = {id(c) for c in components}
+        for (kind, idx), index in self._column_indexes.items():
+            if kind == 'hash':
+                for value in {self._canonical(idx, c[idx]) for c in components}:
+                    rows = [c for c in index[value] if id(c) not in removed]
+                    if rows:
+                        index[value] = rows
+                    else:
+                        del index[value]
+                continue
+            keys, rows = index
+            if len(components) == 1:
+                for key, c in self._column_rows(kind, idx, components):
+                    i = bisect.bisect_left(keys, key)
+                    while rows[i] is not c:
+                        i += 1
+                    del keys[i]
+                    del rows[i]
+            else:
+                kept = [i for i, c in enumerate(rows) if id(c) not in removed]
+                keys[:] = [keys[i] for i in kept]
+                rows[:] = [rows[i] for i in kept]
+
+    def _cached(self, query, compute):
+        """Return the cached result of query or compute() and cache it.
+        The cache is dropped whenever the generation has changed.
+        """
+        with _cache_lock:
+            if self._cache_generation != self.generation:
+                self._cache.clear()
+                self._cache_generation = self.generation
+            result = self._cache.get(query)
+            if result is not None:
+                self._cache.move_to_end(query)
+                self.cache_hits += 1
+                return result
+            self.cache_misses += 1
+        result = compute()
+        with _cache_lock:
+            if self._cache_generation == self.generation and self.cache_size > 0:
+                self._cache[query] = result
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return result
+
+    def find_key(self, key):
+        """Return the component with the given _key() or None."""
+        return self._key_index().get(key)
+
+    def quantity_of(self, component):
+        """Quantity in this category of the component with the same parameters."""
+        existing_component = self.find(component)
+        return 0 if existing_component is None else existing_component[-1]
 
-    @staticmethod
-    def _convert_value_to_abs(value_str: str) -> float:
-        units = value_str[-1]
-        if units.isdigit():
-            return float(value_str)
-        if units not in ComponentCategory._MULTIPLIERS:
-            raise CategoryException(f'No such units: {units}')
-        value = float(value_str[:-1]) * ComponentCategory._MULTIPLIERS[units]
-        return value
+    def _convert_value_to_abs(self, value_str: str, param_str='Value') -> float:
+        try:
+            return values.parse(value_str, values.kind_of(self.name, param_str) or values.LEGACY)
+        except ValueError as e:
+            raise CategoryException(str(e))
 
     def add(self, component_str: str):
-        """Append a new component entry or add to existing one."""
+        """Append a new component entry or add to existing one. Return the entry."""
         new_component = self._str_to_component(component_str)
         existing_component = self.find(new_component)
+        self.generation = next(_generations)
 
         if existing_component is None:
             self.components.append(new_component)
+            self._index[self._key(new_component)] = new_component
+            self._rows_added([new_component])
+            if self._trigrams is not None:
+                self._trigrams.add(new_component)
+            if self._owned_rows is not None:
+                self._owned_rows.add(id(new_component))
+            existing_component = new_component
         else:
             quantity = new_component[-1]
+            existing_component, = self._writable([existing_component])
             existing_component[-1] += quantity
+        return existing_component
 
     def subtract(self, component_str: str):
-        """Subtract component quantity from existing entry.
+        """Subtract component quantity from existing entry and return the entry.
         If 0 such components left after, entry is removed.
         """
         component = self._str_to_component(component_str)
@@ -82,48 +296,444 @@ class ComponentCategory:
         if existing_component is not None:
             quantity = component[-1]
             if quantity <= existing_component[-1]:
-                existing_component[-1] -= quantity
-                if existing_component[-1] == 0:
+                self.generation = next(_generations)
+                if quantity == existing_component[-1]:
                     self.components.remove(existing_component)
+                    del self._index[self._key(existing_component)]
+                    self._rows_removed([existing_component])
+                    if self._trigrams is not None:
+                        self._trigrams.remove(existing_component)
+                    if self._owned_rows is not None:
+                        self._owned_rows.discard(id(existing_component))
+                    # The entry may still be shared, so it is left as it was
+                    return existing_component[:-1] + [0]
+                existing_component, = self._writable([existing_component])
+                existing_component[-1] -= quantity
+                return existing_component
             else:
                 raise CategoryException(f'Cannot substract {component_str} from existing {existing_component[-1]}')
         else:
             raise CategoryException(f'No such component: {component_str} in {self.name}')
 
-    def filter(self, **kwargs):
-        """Return list of components matching the parametric query."""
-        result = []
-        for component in self.components:
-            for kwarg in kwargs:
-                if kwarg not in self.format:
-                    raise CategoryException(f'No param {kwarg} in {self.name}')
-                idx = self.format.index(kwarg)
-                if not (kwarg == 'Name' and component[idx].startswith(kwargs[kwarg])
-                        or component[idx] == kwargs[kwarg]):
-                    break
+    def merge(self, other, sign=1):
+        """Add (sign=1) or subtract (sign=-1) all components of other, of the
+        same format, by hashing their parameters: O(len(self) + len(other)).
+        When subtracting every component is checked first, so nothing changes
+        if one is missing or short.
+        Return (new entries, updated entries, removed entries).
+        """
+        index = self._key_index()
+        if sign < 0:
+            return self._merge_subtract(other, index)
+        new = []
+        updates = []  # (existing component, quantity added)
+        for o_component in other.components:
+            key = self._key(o_component)
+            existing_component = index.get(key)
+            if existing_component is None:
+                new_component = o_component[:]
+                self.components.append(new_component)
+                index[key] = new_component
+                if self._trigrams is not None:
+                    self._trigrams.add(new_component)
+                if self._owned_rows is not None:
+                    self._owned_rows.add(id(new_component))
+                new.append(new_component)
             else:
-                result.append(component)
+                updates.append((existing_component, o_component[-1]))
+        rows = self._writable([existing_component for existing_component, quantity in updates])
+        for existing_component, (_, quantity) in zip(rows, updates):
+            existing_component[-1] += quantity
+        self.generation = next(_generations)
+        if new:
+            self._rows_added(new)
+        return len(new), len(updates), 0
 
+    def _merge_subtract(self, other, index):
+        needed = {}  # key -> [existing component, quantity]
+        for o_component in other.components:
+            existing_component = index.get(self._key(o_component))
+            component_str = ','.join(map(str, o_component))
+            if existing_component is None:
+                raise CategoryException(f'No such component: {component_str} in {self.name}')
+            entry = needed.setdefault(id(existing_component), [existing_component, 0])
+            entry[1] += o_component[-1]
+            if entry[1] > existing_component[-1]:
+                raise CategoryException(f'Cannot substract {component_str} from existing {existing_component[-1]}')
+
+        emptied = []  # Entries used up by other
+        left = []  # (entry, quantity) of the ones that stay
+        for existing_component, quantity in needed.values():
+            if quantity == existing_component[-1]:
+                del index[self._key(existing_component)]
+                if self._trigrams is not None:
+                    self._trigrams.remove(existing_component)
+                if self._owned_rows is not None:
+                    self._owned_rows.discard(id(existing_component))
+                emptied.append(existing_component)
+            else:
+                left.append((existing_component, quantity))
+        rows = self._writable([existing_component for existing_component, quantity in left])
+        for existing_component, (_, quantity) in zip(rows, left):
+            existing_component[-1] -= quantity
+        self.generation = next(_generations)
+        if emptied:
+            # One pass instead of a deque.remove() per emptied entry; rows
+            # that were already at 0 are not ours to drop
+            ids = {id(c) for c in emptied}
+            self.components = deque(c for c in self.components if id(c) not in ids)
+            self._rows_removed(emptied)
+        return 0, len(needed) - len(emptied), len(emptied)
+
+    def filter(self, **kwargs):
+        """Return list of components matching the parametric query.
+        Results are cached until the category changes, do not modify them.
+        """
+        return self._cached(('f',) + tuple(sorted(kwargs.items())), lambda: self._filter(kwargs))
+
+    def _candidates(self, kwargs):
+        """Rows that can match the query: a Name prefix range if there is one."""
+        if 'Name' in kwargs and 'Name' in self.format:
+            return self.prefix_search(kwargs['Name'])
+        return self.components
+
+    def _filter(self, kwargs):
+        result = list(filter(self._match_predicate(kwargs), self._candidates(kwargs)))
         result.sort(reverse=False, key=lambda c: c[-1])
         return ComponentCategory(f'{self.name} filtered', self.format_str, result)
 
     def filter_from_bound(self, param_str, bound_str, operation_str):
         """Return list of components which have the parameter matching the condition."""
+        try:
+            bound = self._convert_value_to_abs(bound_str, param_str)
+        except CategoryException:
+            bound = bound_str  # Fails in the query itself
+        return self._cached(('fb', param_str, bound, operation_str),
+                            lambda: self._filter_from_bound(param_str, bound_str, operation_str))
+
+    def _filter_from_bound(self, param_str, bound_str, operation_str):
+        result = list(filter(self._bound_predicate(param_str, bound_str, operation_str), self.components))
+        result.sort(reverse=False, key=lambda c: c[-1])
+        return ComponentCategory(f'{self.name} filtered', self.format_str, result)
+
+    def _match_predicate(self, kwargs):
+        """Return a function telling whether a component matches the parametric query."""
+        checks = []
+        for kwarg, value in kwargs.items():
+            if kwarg not in self.format:
+                raise CategoryException(f'No param {kwarg} in {self.name}')
+            idx = self.format.index(kwarg)
+            if kwarg == 'Name':
+                checks.append(lambda c, idx=idx, value=value: c[idx].startswith(value))
+            elif idx in self._kinds:
+                # Numeric parameters by value, as in _key(), so Value=4700 matches 4k7
+                value = self._canonical(idx, value)
+                checks.append(lambda c, idx=idx, value=value: self._canonical(idx, c[idx]) == value)
+            else:
+                checks.append(lambda c, idx=idx, value=value: c[idx] == value)
+        return lambda c: all(check(c) for check in checks)
+
+    def _bound_predicate(self, param_str, bound_str, operation_str):
+        """Return a function telling whether a component has the parameter matching the condition."""
+        if param_str not in self.format:
+            raise CategoryException(f'No param {param_str} in {self.name}')
+        if operation_str not in ('>=', '<='):
+            raise CategoryException(f'No such operation: {operation_str}')
+        param_idx = self.format.index(param_str)
+        bound = self._convert_value_to_abs(bound_str, param_str)
+        compare = _COMPARISONS[operation_str]
+
+        def check(c):
+            # Rows whose parameter is not a number never match, as in select()
+            n = self._number(c[param_idx], param_str)
+            return n is not None and compare(n, bound)
+        return check
+
+    def filter_view(self, query, limit=None, offset=0, top=None):
+        """Lazy version of filter(**query), see FilterView."""
+        predicate = self._match_predicate(query)
+        return FilterView(self, predicate, limit, offset, top, source=lambda: self._candidates(query))
+
+    def filter_from_bound_view(self, param_str, bound_str, operation_str, limit=None, offset=0, top=None):
+        """Lazy version of filter_from_bound(), see FilterView."""
+        return FilterView(self, self._bound_predicate(param_str, bound_str, operation_str), limit, offset, top)
+
+    def _values_by_package(self):
+        if self._value_index is None:
+            value_idx = self.format.index('Value')
+            package_idx = self.format.index('Package') if 'Package' in self.format else None
+            groups = {}
+            for c in self.components:
+                try:
+                    value = self._convert_value_to_abs(c[value_idx])
+                except CategoryException:
+                    continue  # Not a numeric value, never a substitute
+                if value > 0:
+                    package = c[package_idx] if package_idx is not None else None
+                    groups.setdefault(package, []).append((value, c))
+            index = {}
+            for package, rows in groups.items():
+                rows.sort(key=lambda row: row[0])
+                index[package] = ([value for value, c in rows], [c for value, c in rows])
+            self._value_index = index  # Only once complete, see _key_index()
+        return self._value_index
+
+    def find_substitutes(self, component, k=3, series=None):
+        """Return up to k components of the same package with the values nearest
+        (by ratio) to the value of component, closest first.
+        With series (e.g. 'E12') only values within one step of that E-series qualify.
+        """
+        if 'Value' not in self.format:
+            raise CategoryException(f'No param Value in {self.name}')
+        if series is not None and series not in E_SERIES:
+            raise CategoryException(f'No such series: {series}')
+        try:
+            value = self._convert_value_to_abs(component[self.format.index('Value')])
+        except CategoryException:
+            return []
+        if value <= 0:
+            return []
+        package = component[self.format.index('Package')] if 'Package' in self.format else None
+        values, components = self._values_by_package().get(package, ((), ()))
+        # Real E-series values are not exactly geometric, so allow a quarter step more
+        max_distance = 1.25 / E_SERIES[series] if series is not None else math.inf
+        key = self._key(component)
+
         result = []
-        for component in self.components:
-            if param_str not in self.format:
-                raise CategoryException(f'No param {param_str} in {self.name}')
-            param_idx = self.format.index(param_str)
-            bound = self._convert_value_to_abs(bound_str)
-            value = self._convert_value_to_abs(component[param_idx])
-            if operation_str == '>=':
-                if value >= bound:
-                    result.append(component)
-            elif operation_str == '<=':
-                if value <= bound:
+        hi = bisect.bisect_left(values, value)
+        lo = hi - 1
+        while len(result) < k and (lo >= 0 or hi < len(values)):
+            lo_distance = abs(math.log10(value / values[lo])) if lo >= 0 else math.inf
+            hi_distance = abs(math.log10(values[hi] / value)) if hi < len(values) else math.inf
+            if min(lo_distance, hi_distance) > max_distance:
+                break
+            if lo_distance <= hi_distance:
+                candidate, lo = components[lo], lo - 1
+            else:
+                candidate, hi = components[hi], hi + 1
+            if self._key(candidate) != key:
+                result.append(candidate)
+        return result
+
+    def _value_key(self, value_str):
+        try:
+            return self._convert_value_to_abs(value_str)
+        except CategoryException:
+            return value_str
+
+    def _rating(self, rating_str, param_str):
+        try:
+            return RATINGS[param_str] * self._convert_value_to_abs(rating_str, param_str)
+        except CategoryException:
+            return None
+
+    def _ratings_by_value(self):
+        if self._rating_index is None:
+            value_idx = self.format.index('Value') if 'Value' in self.format else None
+            package_idx = self.format.index('Package') if 'Package' in self.format else None
+            columns = [(i, p) for i, p in enumerate(self.format[:-1]) if p in RATINGS]
+            index = {}
+            for c in self.components:
+                group = (self._value_key(c[value_idx]) if value_idx is not None else None,
+                         c[package_idx] if package_idx is not None else None)
+                components, rows = index.setdefault(group, ([], []))
+                components.append(c)
+                rows.append(tuple(self._rating(c[i], param) for i, param in columns))
+            self._rating_index = index  # Only once complete, see _key_index()
+        return self._rating_index
+
+    def filter_dominating(self, **kwargs):
+        """Return components with the same Value and Package that are at least
+        as good on every given rating (lower Tolerance, higher Voltage,
+        Current or Wattage), e.g. filter_dominating(Value='10k', Package='0603', Tolerance='1%').
+        """
+        return self._cached(('dom',) + tuple(sorted(kwargs.items())), lambda: self._filter_dominating(kwargs))
+
+    def _filter_dominating(self, kwargs):
+        for param in kwargs:
+            if param not in self.format:
+                raise CategoryException(f'No param {param} in {self.name}')
+            if param not in RATINGS and param not in ('Value', 'Package'):
+                raise CategoryException(f'Param {param} is not a rating')
+        ratings = [p for p in self.format[:-1] if p in RATINGS]
+        bounds = []
+        for param in ratings:
+            if param in kwargs:
+                bound = self._rating(kwargs[param], param)
+                if bound is None:
+                    raise CategoryException(f'Not a number: {param}={kwargs[param]}')
+                bounds.append((ratings.index(param), bound))
+
+        group = (self._value_key(kwargs['Value']) if 'Value' in self.format and 'Value' in kwargs else None,
+                 kwargs.get('Package') if 'Package' in self.format else None)
+        groups = self._ratings_by_value()
+        if None in group and ('Value' in self.format or 'Package' in self.format):
+            # Value or Package left open: every matching group qualifies
+            keys = [key for key in groups if all(g is None or g == k for g, k in zip(group, key))]
+        else:
+            keys = [group]
+        result = []
+        for key in keys:
+            components, rows = groups.get(key, ((), ()))
+            for component, row in zip(components, rows):
+                if all(row[i] is not None and row[i] >= bound for i, bound in bounds):
                     result.append(component)
+        result.sort(reverse=False, key=lambda c: c[-1])
+        return ComponentCategory(f'{self.name} dominating', self.format_str, result)
+
+    def _number(self, value_str, param_str):
+        try:
+            return self._convert_value_to_abs(value_str, param_str)
+        except CategoryException:
+            return None
+
+    def _canonical(self, idx, value_str):
+        """Value of column idx as in _key(): a number for numeric parameters."""
+        kind = self._kinds.get(idx)
+        if kind is not None:
+            try:
+                return values.parse(value_str, kind)
+            except ValueError:
+                pass
+        return value_str
+
+    def _column_index(self, kind, idx):
+        """Return a lazily built index of column idx:
+        'hash': {canonical value: [components]},
+        'number': (sorted numbers, components), rows that are not numbers left out,
+        'text': (sorted strings, components).
+        """
+        index = self._column_indexes.get((kind, idx))
+        if index is None:
+            if kind == 'hash':
+                index = {}
+                for c in self.components:
+                    index.setdefault(self._canonical(idx, c[idx]), []).append(c)
+            else:
+                rows = self._column_rows(kind, idx, self.components)
+                index = ([key for key, c in rows], [c for key, c in rows])
+            self._column_indexes[(kind, idx)] = index
+        return index
+
+    def _column_rows(self, kind, idx, components):
+        """(key, component) of components in a sorted index, sorted by key."""
+        if kind == 'number':
+            param_str = self.format[idx]
+            rows = [(self._number(c[idx], param_str), c) for c in components]
+            rows = [row for row in rows if row[0] is not None]
+        else:
+            rows = [(c[idx], c) for c in components]
+        rows.sort(key=lambda row: row[0])
+        return rows
+
+    def _condition_index(self, condition):
+        """Return (number of candidates, function returning them) from the
+        index serving condition or None if no index can.
+        """
+        idx = self._param_index(condition.param)
+        if idx == len(self.format) - 1:
+            return None  # Quantity changes all the time, never indexed
+        if condition.op == '=':
+            rows = self._column_index('hash', idx).get(self._canonical(idx, condition.value), [])
+            return len(rows), lambda: rows
+        if condition.op == '^=':
+            rows, lo, hi = self._prefix_range(idx, condition.value)
+        else:
+            keys, rows = self._column_index('number', idx)
+            bound = self._convert_value_to_abs(condition.value, condition.param)
+            lo, hi = 0, len(keys)
+            if condition.op in ('>=', '>'):
+                lo = (bisect.bisect_left if condition.op == '>=' else bisect.bisect_right)(keys, bound)
             else:
-                raise CategoryException(f'No such operation: {operation_str}')
+                hi = (bisect.bisect_right if condition.op == '<=' else bisect.bisect_left)(keys, bound)
+        return max(hi - lo, 0), lambda: rows[lo:hi]
+
+    def _prefix_range(self, idx, prefix):
+        """Return (components sorted by column idx, start, end) of the ones starting with prefix."""
+        keys, rows = self._column_index('text', idx)
+        lo = bisect.bisect_left(keys, prefix)
+        hi = bisect.bisect_left(keys, prefix + chr(0x10ffff), lo)
+        return rows, lo, hi
+
+    def prefix_search(self, prefix, param_str='Name'):
+        """Return components whose parameter starts with prefix, ordered by it.
+        Takes O(log n + matches) with the sorted index of the column.
+        """
+        if param_str not in self.format:
+            raise CategoryException(f'No param {param_str} in {self.name}')
+        rows, lo, hi = self._prefix_range(self.format.index(param_str), prefix)
+        return rows[lo:hi]
+
+    def fuzzy_search(self, text, threshold=0.5):
+        """Return (score, component) of the components sharing at least
+        threshold of the trigrams of text in any parameter, see trigram.py.
+        """
+        if self._trigrams is None:
+            trigrams = TrigramIndex()
+            for c in self.components:
+                trigrams.add(c)
+            self._trigrams = trigrams
+        return self._trigrams.search(text, threshold)
+
+    def _param_index(self, param_str):
+        """Column of param_str in a query, Qty being the quantity whatever its name."""
+        if param_str in self.format:
+            return self.format.index(param_str)
+        if param_str == 'Qty':
+            return len(self.format) - 1
+        raise CategoryException(f'No param {param_str} in {self.name}')
+
+    def _condition_predicate(self, condition):
+        """Return a function telling whether a component meets condition."""
+        param_str, op, value_str = condition
+        idx = self._param_index(param_str)
+        if op == '^=':
+            if idx == len(self.format) - 1:
+                raise CategoryException('Quantity is a number, use =, >=, <=, > or < instead of ^=')
+            return lambda c: c[idx].startswith(value_str)
+        if idx == len(self.format) - 1:
+            try:
+                bound = int(value_str)
+            except ValueError:
+                raise CategoryException(f'Quantity must be integer: {value_str}')
+            number = lambda c: c[-1]
+        else:
+            if op == '=':
+                value = self._canonical(idx, value_str)
+                return lambda c: self._canonical(idx, c[idx]) == value
+            bound = self._convert_value_to_abs(value_str, param_str)
+            number = lambda c: self._number(c[idx], param_str)
+        compare = _COMPARISONS[op]
+
+        def check(c):
+            n = number(c)
+            return n is not None and compare(n, bound)
+        return check
+
+    def select(self, conditions):
+        """Return components meeting every condition (query.Condition).
+        The condition whose index yields the fewest candidates picks the
+        rows, the other conditions are checked on those only.
+        """
+        conditions = list(conditions)
+        return self._cached(('q',) + tuple(sorted(conditions)), lambda: self._select(conditions))
+
+    def _select(self, conditions):
+        predicates = [self._condition_predicate(condition) for condition in conditions]
+        best = None
+        for i, condition in enumerate(conditions):
+            candidates = self._condition_index(condition)
+            if candidates is not None and (best is None or candidates[0] < best[1][0]):
+                best = i, candidates
+        if best is None:
+            rows = self.components
+        else:
+            i, (count, fetch) = best
+            rows = fetch()
+            del predicates[i]
+        if instrumentation.enabled:
+            instrumentation.count('select: candidate rows', len(rows))
+        result = [c for c in rows if all(predicate(c) for predicate in predicates)]
         result.sort(reverse=False, key=lambda c: c[-1])
         return ComponentCategory(f'{self.name} filtered', self.format_str, result)
 
@@ -134,19 +744,14 @@ class ComponentCategory:
                     f'Format mismatch: {other.name}:{other.format_str} <> {self.name}:{self.format_str}')
         not_in_stock = []
         for o_component in other.components:
-            for component in self.components:
-                for i in range(len(component) - 1):
-                    if component[i] != o_component[i]:
-                        break
-                else:
-                    quantity = o_component[-1] - component[-1]
-                    if quantity > 0:
-                        component = component[:]
-                        component[-1] = quantity
-                        not_in_stock.append(component)
-                    break
-            else:
+            component = self.find(o_component)
+            if component is None:
                 not_in_stock.append(o_component[:])
+            elif o_component[-1] > component[-1]:
+                quantity = o_component[-1] - component[-1]
+                component = component[:]
+                component[-1] = quantity
+                not_in_stock.append(component)
         return ComponentCategory(f'{self.name} not in stock', self.format_str, not_in_stock)
 
     def __str__(self):
@@ -164,6 +769,9 @@ class ComponentCategory:
         return table
 
     def get_all_variants_of_param(self, param_str):
+        return list(self._cached(('v', param_str), lambda: self._variants(param_str)))
+
+    def _variants(self, param_str):
         if param_str not in self.format:
             raise CategoryException(f'No param {param_str} in {self.name}')
         idx = self.format.index(param_str)
@@ -172,5 +780,57 @@ class ComponentCategory:
             variants.add(c[idx])
         return list(variants)
 
+    def cache_info(self):
+        """Return (cached results, hits, misses) of the query cache."""
+        return len(self._cache), self.cache_hits, self.cache_misses
+
     def has_param(self, param_str):
         return param_str in self.format
+
+
+class FilterView:
+    """Components of a category matching a predicate, found only while iterated.
+    Rows come in category order (in Name order for a Name prefix); with top only the k with the largest
+    quantity are kept (in a heap), largest first. offset and limit then
+    select a window of those rows. Iterating stops as soon as limit rows
+    are found, so nothing is copied or sorted in full.
+    """
+
+    def __init__(self, category, predicate, limit=None, offset=0, top=None, source=None):
+        if limit is not None and limit < 0 or offset < 0 or top is not None and top < 0:
+            raise CategoryException('limit, offset and top cannot be negative')
+        self.category = category
+        self.predicate = predicate
+        self.source = source  # Returns the rows to check, all of the category by default
+        self.name = f'{category.name} filtered'
+        self.format_str = category.format_str
+        self.format = category.format
+        self.limit = limit
+        self.offset = offset
+        self.top = top
+
+    def __iter__(self):
+        rows = filter(self.predicate, self.source() if self.source is not None else self.category.components)
+        if self.top is not None:
+            rows = iter(heapq.nlargest(self.top, rows, key=lambda c: c[-1]))
+        stop = self.offset + self.limit if self.limit is not None else None
+        return itertools.islice(rows, self.offset, stop)
+
+    @property
+    def components(self):
+        return list(self)
+
+    def materialize(self):
+        """Return the current rows as a ComponentCategory."""
+        return ComponentCategory(self.name, self.format_str, self)
+
+    def __str__(self):
+        data = [self.format] + self.components
+        return f'{self.name}\n{tabulate(data, headers="firstrow", tablefmt="fancy_grid")}'
+
+    def __bool__(self):
+        return next(iter(self), None) is not None
+
+    def convert_to_csv(self):
+        components = list(','.join(map(str, c)) for c in self)
+        return "{}\n{}\n{}".format(self.name, self.format_str, '\n'.join(components))
@@ -1,5 +1,5 @@
 import os, sys
-from thirdparty import kicad_netlist_reader
+import netlist_reader
 from database import Database
 
 
@@ -16,7 +16,7 @@ def is_known_parameter(param_str, value_str):
     return param_str in known and value_str[-1] == known[param_str]
 
 
-net = kicad_netlist_reader.netlist(sys.argv[1])
+net = netlist_reader.read_netlist(sys.argv[1])
 components = net.getInterestingComponents(excludeBOM=True)
 
 stock_db = Database()
@@ -1,14 +1,97 @@
-from category import ComponentCategory
+import functools
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from category import ComponentCategory, CategoryException
+import query
+from rwlock import RWLock
+import instrumentation
 
 
 class DatabaseException(Exception):
     pass
 
 
+def _reads(method):
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        if self._lock is None:
+            return method(self, *args, **kwargs)
+        with self._lock.reading():
+            return method(self, *args, **kwargs)
+    return locked
+
+
+def _writes(method):
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        if self._lock is None:
+            return method(self, *args, **kwargs)
+        with self._lock.writing():
+            return method(self, *args, **kwargs)
+    return locked
+
+
 class Database:
+    """Stock or project database: a dict of ComponentCategory by name.
+
+    With thread_safe=True every method takes a reader-writer lock, so many
+    queries can run alongside occasional updates. snapshot() gives a
+    consistent read-only copy that can be queried without any locking.
+
+    Listeners are called as listener(db, cat_name, key) after every change:
+    key is the _key() of the changed component, None if any component of
+    the category may have changed, and cat_name is None if all of them may.
+    """
 
-    def __init__(self):
+    def __init__(self, thread_safe=False):
         self.categories = {}
+        self._owned = set()  # Categories not shared with any snapshot
+        self._lock = RWLock() if thread_safe else None
+        self._listeners = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def _notify(self, cat_name, key):
+        for listener in self._listeners:
+            listener(self, cat_name, key)
+
+    def _own(self, cat_name):
+        """Fork a category shared with a snapshot before changing it."""
+        if cat_name not in self._owned:
+            self.categories[cat_name] = self.categories[cat_name].fork()
+            self._owned.add(cat_name)
+        return self.categories[cat_name]
+
+    @_writes
+    def snapshot(self):
+        """Return a copy of the database sharing all categories with it.
+        Costs O(number of categories); a category is forked only when one
+        side changes it afterwards, and only the rows changed are copied.
+        """
+        snap = Database()
+        snap.categories = self.categories.copy()
+        self._owned.clear()
+        return snap
+
+    @_writes
+    def restore(self, snap):
+        """Make the categories those of snap again, sharing them with it.
+        Only the categories that differ from snap are announced to listeners.
+        """
+        changed = [cat_name for cat_name in set(self.categories) | set(snap.categories)
+                   if dict.get(self.categories, cat_name) is not dict.get(snap.categories, cat_name)]
+        self.categories = snap.categories.copy()
+        self._owned.clear()
+        for cat_name in changed:
+            self._notify(cat_name, None)
+
+    def _read_view(self, other):
+        """Snapshot other if other threads may change it while we read it."""
+        return other.snapshot() if other._lock is not None else other
 
     def _check_catname(self, cat_name):
         cat_name = cat_name.strip()
@@ -16,31 +99,138 @@ class Database:
             raise DatabaseException(f'Category {cat_name} does not exist')
         return cat_name
 
+    @_writes
     def add_category(self, cat_name, cat_format_str):
         cat_name = cat_name.strip()
         if cat_name in self.categories:
             raise DatabaseException(f'Category {cat_name} already exists')
         self.categories[cat_name] = ComponentCategory(cat_name, cat_format_str)
+        self._owned.add(cat_name)
+        if self._listeners:
+            self._notify(cat_name, None)
 
+    @_writes
     def add_component(self, cat_name, component_str):
         cat_name = self._check_catname(cat_name)
-        self.categories[cat_name].add(component_str)
+        category = self._own(cat_name)
+        component = category.add(component_str)
+        if self._listeners:
+            self._notify(cat_name, category._key(component))
 
+    @_writes
     def subtract_component(self, cat_name, component_str):
         cat_name = self._check_catname(cat_name)
-        self.categories[cat_name].subtract(component_str)
-        if not self.categories[cat_name]:
+        category = self._own(cat_name)
+        component = category.subtract(component_str)
+        if not category:
             del self.categories[cat_name]
+            self._owned.discard(cat_name)
+        if self._listeners:
+            self._notify(cat_name, category._key(component))
 
+    @_reads
     def filter_components(self, cat_name, **kwargs):
         cat_name = self._check_catname(cat_name)
         return self.categories[cat_name].filter(**kwargs)
 
+    @_reads
     def filter_components_from_bound(self, cat_name, param_str, bound_str, operation_str):
         cat_name = self._check_catname(cat_name)
         return self.categories[cat_name].filter_from_bound(param_str, bound_str, operation_str)
 
+    @_reads
+    def filter_all(self, max_workers=None, **kwargs):
+        """filter_components() over every category having all the parameters
+        of the query, in a thread pool. Return a Database of the matches.
+        """
+        return self._filter_all(list(kwargs), lambda cat: cat.filter(**kwargs).components, max_workers)
+
+    @_reads
+    def filter_all_from_bound(self, param_str, bound_str, operation_str, max_workers=None):
+        """filter_components_from_bound() over every category having param_str."""
+        return self._filter_all([param_str], lambda cat: cat.filter_from_bound(
+                param_str, bound_str, operation_str).components, max_workers)
+
+    def _filter_all(self, params, matches, max_workers):
+        # Only the format is needed to skip a category, so skipped ones are not even loaded
+        names = [cat_name for cat_name, cat in dict.items(self.categories)
+                 if all(p in cat.format_str.split(',') for p in params)]
+        cats = [self.categories[cat_name] for cat_name in names]
+        found = Database()
+        if not cats:
+            return found
+        # Categories are independent and each caches its own indexes and results
+        with ThreadPoolExecutor(max_workers=min(len(cats), max_workers or 4)) as pool:
+            results = list(pool.map(matches, cats))
+        for cat, components in zip(cats, results):
+            if components:
+                found.categories[cat.name] = ComponentCategory(cat.name, cat.format_str, [c[:] for c in components])
+                found._owned.add(cat.name)
+        return found
+
+    @_reads
+    def query(self, query_str):
+        """Return components matching a query expression, see query.py."""
+        cat_name, conditions = query.parse(query_str)
+        cat_name = self._check_catname(cat_name)
+        return self.categories[cat_name].select(conditions)
+
+    @_reads
+    def search_prefix(self, prefix):
+        """Return a Database of the components in all categories with a Name
+        parameter whose Name starts with prefix.
+        """
+        found = Database()
+        for cat_name, cat in self.categories.items():
+            if cat.has_param('Name'):
+                components = cat.prefix_search(prefix)
+                if components:
+                    found.categories[cat_name] = ComponentCategory(
+                        cat_name, cat.format_str, [c[:] for c in components])
+                    found._owned.add(cat_name)
+        return found
+
+    @_reads
+    def fuzzy_search(self, text, limit=20, threshold=0.5):
+        """Return up to limit (score, cat_name, component) of the components
+        best matching text in any parameter of any category, best first.
+        """
+        found = ((score, cat_name, component)
+                 for cat_name, cat in self.categories.items()
+                 for score, component in cat.fuzzy_search(text, threshold))
+        return heapq.nlargest(limit, found, key=lambda match: (match[0], match[2][-1]))
+
+    @_reads
+    def filter_components_view(self, cat_name, query, limit=None, offset=0, top=None):
+        """Lazy filter_components() with limit, offset and top-k by quantity.
+        A thread-safe database returns the rows found under its lock instead.
+        """
+        cat_name = self._check_catname(cat_name)
+        view = self.categories[cat_name].filter_view(query, limit, offset, top)
+        return view if self._lock is None else view.materialize()
+
+    @_reads
+    def filter_components_from_bound_view(self, cat_name, param_str, bound_str, operation_str,
+                                          limit=None, offset=0, top=None):
+        """Lazy filter_components_from_bound(), see filter_components_view()."""
+        cat_name = self._check_catname(cat_name)
+        view = self.categories[cat_name].filter_from_bound_view(
+            param_str, bound_str, operation_str, limit, offset, top)
+        return view if self._lock is None else view.materialize()
+
+    @_reads
+    def filter_components_dominating(self, cat_name, **kwargs):
+        cat_name = self._check_catname(cat_name)
+        return self.categories[cat_name].filter_dominating(**kwargs)
+
     def calc_difference(self, other):
+        other = self._read_view(other)
+        if self._lock is None:
+            return self._calc_difference(other)
+        with self._lock.reading():
+            return self._calc_difference(other)
+
+    def _calc_difference(self, other):
         ns_db = Database()
         for o_cat_name in other.categories:
             o_cat = other.categories[o_cat_name]
@@ -58,25 +248,182 @@ class Database:
         return ns_db
 
     def subtract_other(self, other):
-        if self.calc_difference(other):
+        self.merge(other, -1)
+
+    def merge(self, other, sign=1):
+        """Add (sign=1) or subtract (sign=-1) all components of other with one
+        hash lookup per component, O(n + m) in total.
+        Everything is checked before anything changes: a category format
+        differing from other's, or components missing or short in stock
+        when subtracting, raise an exception and leave the database as it was.
+        Return {'new': entries, 'updated': entries, 'removed': entries}.
+        """
+        other = self._read_view(other)
+        if self._lock is None:
+            return self._merge(other, sign)
+        with self._lock.writing():
+            return self._merge(other, sign)
+
+    def _merge(self, other, sign):
+        for cat_name, o_cat in other.categories.items():
+            cat = self.categories.get(cat_name)
+            if cat is not None and cat.format != o_cat.format:
+                raise DatabaseException(
+                    f'Format mismatch: {cat_name}:{o_cat.format_str} <> {cat.format_str}')
+        if sign < 0 and self._calc_difference(other):
             raise DatabaseException(f'Cannot subtract components of other DB from self')
-        for o_cat_name in other.categories:
-            for o_component in other.categories[o_cat_name].components:
-                self.subtract_component(o_cat_name, ','.join(map(str, o_component)))
 
+        summary = {'new': 0, 'updated': 0, 'removed': 0}
+        for cat_name, o_cat in other.categories.items():
+            if not o_cat:
+                continue
+            if cat_name not in self.categories:
+                self.categories[cat_name] = o_cat.copy()
+                self._owned.add(cat_name)
+                summary['new'] += len(o_cat.components)
+            else:
+                new, updated, removed = self._own(cat_name).merge(o_cat, sign)
+                summary['new'] += new
+                summary['updated'] += updated
+                summary['removed'] += removed
+                if not self.categories[cat_name]:
+                    del self.categories[cat_name]
+                    self._owned.discard(cat_name)
+            if self._listeners:
+                self._notify(cat_name, None)
+        return summary
+
+    def calc_kit_shortage(self, projects):
+        """Combined shortage of building several projects from this stock.
+        projects is a list of (label, project Database, number of builds).
+        Demand is summed per component over all projects first, so the stock
+        is looked up once per distinct component.
+        Return (shortage Database, shares) where shares lists every short
+        component as (cat_name, component, in stock, total demand, {label: demand}).
+        """
+        formats = {}
+        demand = {}  # cat_name -> {parameters: [component, total, {label: quantity}]}
+        for label, project, builds in projects:
+            project = self._read_view(project)
+            for cat_name, cat in project.categories.items():
+                if formats.setdefault(cat_name, cat.format_str) != cat.format_str:
+                    raise DatabaseException(
+                        f'Format mismatch: {label}:{cat_name}:{cat.format_str} <> {formats[cat_name]}')
+                cat_demand = demand.setdefault(cat_name, {})
+                for component in cat.components:
+                    quantity = component[-1] * builds
+                    key = cat._key(component)
+                    entry = cat_demand.get(key)
+                    if entry is None:
+                        entry = cat_demand[key] = [component, 0, {}]
+                    entry[1] += quantity
+                    entry[2][label] = entry[2].get(label, 0) + quantity
+
+        if self._lock is None:
+            return self._calc_kit_shortage(formats, demand)
+        with self._lock.reading():
+            return self._calc_kit_shortage(formats, demand)
+
+    def _calc_kit_shortage(self, formats, demand):
+        ns_db = Database()
+        shares = []
+        for cat_name, cat_demand in demand.items():
+            cat = self.categories.get(cat_name)
+            if cat is not None and cat.format_str != formats[cat_name]:
+                raise DatabaseException(
+                    f'Format mismatch: {cat_name}:{formats[cat_name]} <> stock {cat.format_str}')
+            not_in_stock = []
+            for component, total, project_demand in cat_demand.values():
+                in_stock = cat.quantity_of(component) if cat is not None else 0
+                if total > in_stock:
+                    not_in_stock.append(component[:-1] + [total - in_stock])
+                    shares.append((cat_name, component, in_stock, total, project_demand))
+            if not_in_stock:
+                ns_db.categories[cat_name] = ComponentCategory(cat_name, formats[cat_name], not_in_stock)
+                ns_db._owned.add(cat_name)
+        return ns_db, shares
+
+    def calc_max_builds(self, project):
+        """Maximum number of complete project builds this stock supports.
+        One pass over the project rows with a stock index lookup each.
+        Return (builds, limiting) where limiting lists the components that
+        run out first as (cat_name, component, in stock, missing for one more build).
+        """
+        project = self._read_view(project)
+        if self._lock is None:
+            return self._calc_max_builds(project)
+        with self._lock.reading():
+            return self._calc_max_builds(project)
+
+    def _calc_max_builds(self, project):
+        builds = None
+        limiting = []
+        for cat_name, o_cat in project.categories.items():
+            cat = self.categories.get(cat_name)
+            if cat is not None and cat.format_str != o_cat.format_str:
+                raise DatabaseException(
+                    f'Format mismatch: {cat_name}:{o_cat.format_str} <> stock {cat.format_str}')
+            for component in o_cat.components:
+                per_build = component[-1]
+                if per_build <= 0:
+                    continue
+                in_stock = cat.quantity_of(component) if cat is not None else 0
+                component_builds = in_stock // per_build
+                if builds is None or component_builds < builds:
+                    builds = component_builds
+                    limiting = []
+                if component_builds == builds:
+                    limiting.append((cat_name, component, in_stock))
+        if builds is None:
+            raise DatabaseException('Project database is empty')
+        return builds, [(cat_name, component, in_stock, (builds + 1) * component[-1] - in_stock)
+                        for cat_name, component, in_stock in limiting]
+
+    def find_substitutes(self, shortage, k=3, series=None):
+        """Nearest-value substitutes in stock for every component of shortage
+        in a category with a Value parameter, see ComponentCategory.find_substitutes.
+        Return a list of (cat_name, component, substitutes) for the components
+        that have any.
+        """
+        shortage = self._read_view(shortage)
+        if self._lock is None:
+            return self._find_substitutes(shortage, k, series)
+        with self._lock.reading():
+            return self._find_substitutes(shortage, k, series)
+
+    def _find_substitutes(self, shortage, k, series):
+        result = []
+        for cat_name, o_cat in shortage.categories.items():
+            cat = self.categories.get(cat_name)
+            if cat is None or not cat.has_param('Value'):
+                continue
+            if cat.format_str != o_cat.format_str:
+                raise DatabaseException(
+                    f'Format mismatch: {cat_name}:{o_cat.format_str} <> stock {cat.format_str}')
+            for component in o_cat.components:
+                substitutes = cat.find_substitutes(component, k, series)
+                if substitutes:
+                    result.append((cat_name, component, substitutes))
+        return result
+
+    @_reads
     def __str__(self):
         return '\n\n'.join(str(self.categories[c]) for c in self.categories)
 
+    @_reads
     def category_to_str(self, cat_name):
         cat_name = self._check_catname(cat_name)
         return str(self.categories[cat_name])
 
+    @_reads
     def convert_to_csv(self):
         return '\n'.join(self.categories[cat].convert_to_csv() for cat in self.categories)
 
+    @_writes
     def load_from_csv(self, lines):
         cat_name = 'NoName'
         new_cat = False
+        parsed = 0
         for line in lines:
             if line[-1] == '\n':
                 line = line[:-1]
@@ -99,21 +446,38 @@ class Database:
                 continue
 
             self.add_component(cat_name, line)
+            parsed += 1
 
+        if instrumentation.enabled:
+            instrumentation.count('load_from_csv: rows parsed', parsed)
+
+    @_writes
     def clear(self):
         self.categories.clear()
+        self._owned.clear()
+        if self._listeners:
+            self._notify(None, None)
 
+    @_reads
     def __bool__(self):
         return bool(self.categories)
 
+    @_reads
+    def cache_info(self):
+        """Return (cat_name, cached results, hits, misses) of every category's query cache."""
+        return [(cat_name, *cat.cache_info()) for cat_name, cat in self.categories.items()]
+
+    @_reads
     def get_category_format(self, cat_name):
         cat_name = self._check_catname(cat_name)
         return self.categories[cat_name].format
 
+    @_reads
     def get_all_variants_of_param(self, cat_name, param_str):
         cat_name = self._check_catname(cat_name)
         return self.categories[cat_name].get_all_variants_of_param(param_str)
 
+    @_reads
     def category_has_param(self, cat_name, param_str):
         cat_name = self._check_catname(cat_name)
         return self.categories[cat_name].has_param(param_str)
\ No newline at end of file
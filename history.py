@@ -0,0 +1,96 @@
+"""Undo and redo of changes to a Database.
+
+Every step is a snapshot(), so it shares all categories with the database
+and the other steps. Only a category changed after a step is forked, which
+makes a step cost O(rows of the changed categories) references and undo
+O(number of categories). History is bounded by the number of steps and by
+the rows of the category versions only the steps keep.
+"""
+from database import DatabaseException
+
+
+def _same(a, b):
+    # Categories are replaced, never changed in place, while shared with a snapshot;
+    # a fork keeps the generation until it is changed
+    return a.keys() == b.keys() and all(_same_category(dict.get(b, cat_name), category)
+                                        for cat_name, category in dict.items(a))
+
+
+def _same_category(a, b):
+    return a is b or getattr(a, 'generation', a) == getattr(b, 'generation', b)
+
+
+class History:
+    """Bounded undo/redo stacks of db states. Call checkpoint() before a
+    change and commit() after it; a checkpoint that changed nothing is dropped.
+    Besides size steps, the oldest steps are dropped once the categories kept
+    only by the history have more than max_rows rows, the last one excepted.
+    """
+
+    def __init__(self, db, size=20, max_rows=2000000):
+        self.db = db
+        self.size = size
+        self.max_rows = max_rows
+        self._undo = []
+        self._redo = []
+        self._pending = None
+
+    def checkpoint(self):
+        # No snapshot without history, it makes the next change copy its category
+        self._pending = self.db.snapshot() if self.size > 0 else None
+
+    def commit(self):
+        snap, self._pending = self._pending, None
+        if snap is None or _same(snap.categories, self.db.categories):
+            return False
+        self._undo.append(snap)
+        self._redo.clear()
+        self._trim(self._undo)
+        return True
+
+    def resize(self, size, max_rows=None):
+        if size < 0:
+            raise DatabaseException(f'History size must not be negative: {size}')
+        if max_rows is not None and max_rows < 0:
+            raise DatabaseException(f'History rows must not be negative: {max_rows}')
+        self.size = size
+        if max_rows is not None:
+            self.max_rows = max_rows
+        self._trim(self._redo)
+        self._trim(self._undo)
+
+    def _trim(self, stack):
+        if len(stack) > self.size:
+            del stack[:len(stack) - self.size]  # Oldest steps first
+        while len(stack) > 1 and self.rows() > self.max_rows:
+            del stack[0]
+
+    def rows(self):
+        """Rows of the category versions kept only by the undo and redo steps."""
+        seen = {id(category) for category in dict.values(self.db.categories)}
+        rows = 0
+        for snap in self._undo + self._redo:
+            for category in dict.values(snap.categories):
+                if id(category) not in seen:
+                    seen.add(id(category))
+                    rows += len(getattr(category, 'components', ()))
+        return rows
+
+    def undo(self):
+        if not self._undo:
+            raise DatabaseException('Nothing to undo')
+        self._redo.append(self.db.snapshot())
+        self.db.restore(self._undo.pop())
+
+    def redo(self):
+        if not self._redo:
+            raise DatabaseException('Nothing to redo')
+        self._undo.append(self.db.snapshot())
+        self.db.restore(self._redo.pop())
+
+    def __len__(self):
+        return len(self._undo)
+
+    @property
+    def redo_steps(self):
+        return len(self._redo)
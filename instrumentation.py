@@ -0,0 +1,81 @@
+import cProfile
+import io
+import pstats
+import time
+from collections import Counter
+from tabulate import tabulate
+
+# Everything here is off by default. Hot paths only check `enabled` and
+# count their work once per call, so the disabled cost is a single branch.
+enabled = False
+profiling = False
+
+counters = Counter()
+timings = {}  # command -> [calls, total, last, max]
+last_command = None
+last_profile = None
+
+
+def count(name, n=1):
+    counters[name] += n
+
+
+def reset():
+    global last_command, last_profile
+    counters.clear()
+    timings.clear()
+    last_command = None
+    last_profile = None
+
+
+def run(command, callback, args):
+    """Run a REPL command callback, timing (and optionally profiling) it."""
+    global last_command, last_profile
+    if not enabled:
+        return callback(args)
+
+    profiler = cProfile.Profile() if profiling else None
+    start = time.perf_counter()
+    try:
+        if profiler is not None:
+            return profiler.runcall(callback, args)
+        return callback(args)
+    finally:
+        elapsed = time.perf_counter() - start
+        entry = timings.setdefault(command, [0, 0.0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = elapsed
+        entry[3] = max(entry[3], elapsed)
+        last_command = command
+        if profiler is not None:
+            last_profile = profiler
+
+
+def report():
+    data = [['Command', 'Calls', 'Total, ms', 'Last, ms', 'Max, ms']]
+    for command, (calls, total, last, longest) in sorted(timings.items()):
+        data.append([command, calls, f'{total * 1000:.2f}', f'{last * 1000:.2f}', f'{longest * 1000:.2f}'])
+    text = tabulate(data, headers='firstrow', tablefmt='fancy_grid')
+    if counters:
+        data = [['Counter', 'Value']] + sorted(counters.items())
+        text += '\n' + tabulate(data, headers='firstrow', tablefmt='fancy_grid')
+    return text
+
+
+def profile_report(limit=25):
+    """Return the cProfile report of the last command or None."""
+    if last_profile is None:
+        return None
+    stream = io.StringIO()
+    stats = pstats.Stats(last_profile, stream=stream)
+    stats.sort_stats('cumulative').print_stats(limit)
+    return f'Profile of {last_command}:\n{stream.getvalue()}'
+
+
+def dump_profile(filename):
+    """Save the last cProfile run in pstats format. Return False if there is none."""
+    if last_profile is None:
+        return False
+    last_profile.dump_stats(filename)
+    return True
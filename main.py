@@ -1,6 +1,13 @@
 import os, sys
-from category import CategoryException
+import argparse
+import glob
+from category import CategoryException, ComponentCategory
 from database import Database, DatabaseException
+from shortage import ShortageView
+from history import History
+import storage
+import instrumentation
+from tabulate import tabulate
 
 __author__ = "Daniel Efimenko"
 __copyright__ = "Copyright 2024, The DxStock command-line electronic components management tool"
@@ -9,21 +16,59 @@ __version__ = "1.0.0"
 
 PATH_TO_DB = os.path.dirname(os.path.realpath(__file__))
 
+
+class CommandException(Exception):
+    pass  # Wrong use of a REPL command
+
+
 stock_db = Database()
 project_db = Database()
 not_in_stock_db = None
+shortage = ShortageView(stock_db, project_db)  # None with a remote stock database
+history = History(stock_db)  # None with a remote stock database
+stores = {}  # Path -> storage.DirectoryStore of the stock directories loaded or saved
+
+
+def get_store(path):
+    path = os.path.realpath(path)
+    if path not in stores:
+        stores[path] = storage.DirectoryStore(path)
+    return stores[path]
 
 
 def cmd_load_stock_db(args):
-    filename = args[0]
-    with open(f"{PATH_TO_DB}/{filename}", 'r') as f:
-        lines = f.readlines()
-        stock_db.load_from_csv(lines)
+    paths = []
+    for pattern in [args[0]] + args[1:]:
+        matches = sorted(glob.glob(f"{PATH_TO_DB}/{pattern}"))
+        paths.extend(matches if matches else [f"{PATH_TO_DB}/{pattern}"])
+    if len(paths) == 1 and os.path.isdir(paths[0]):
+        get_store(paths[0]).load(stock_db)
         print('Stock database loaded.')
+        return
+    if len(paths) == 1:
+        with open(paths[0], 'r') as f:
+            lines = f.readlines()
+            stock_db.load_from_csv(lines)
+            print('Stock database loaded.')
+        return
+
+    for path in paths:
+        if os.path.isdir(path):
+            get_store(path).load(stock_db)
+    files = [path for path in paths if not os.path.isdir(path)]
+    conflicts = storage.load_csv_files(stock_db, files)
+    for path, cat_name, format_str, file_format_str in conflicts:
+        print(f'Format conflict: {cat_name} is {format_str} but {file_format_str} in '
+              f'{os.path.relpath(path, PATH_TO_DB)}, not loaded')
+    print(f'Stock database loaded from {len(paths)} files.')
 
 
 def cmd_save_stock_db(args):
     filename = args[0]
+    if storage.is_directory_db(f"{PATH_TO_DB}/{filename}"):
+        written = get_store(f"{PATH_TO_DB}/{filename}").save(stock_db)
+        print(f'Stock database saved ({written} changed categories written).')
+        return
     with open(f"{PATH_TO_DB}/{filename}", 'w') as f:
         text = stock_db.convert_to_csv()
         f.write(text)
@@ -39,6 +84,32 @@ def cmd_print_stock_db(args):
         print(stock_db)
 
 
+def read_delta(filename):
+    delta = Database()
+    with open(f"{PATH_TO_DB}/{filename}", 'r') as f:
+        delta.load_from_csv(f.readlines())
+    return delta
+
+
+def cmd_receive(args):
+    summary = stock_db.merge(read_delta(args[0]))
+    print(f"Received: {summary['new']} new entries, {summary['updated']} updated.")
+
+
+def cmd_issue(args):
+    delta = read_delta(args[0])
+    try:
+        summary = stock_db.merge(delta, -1)
+    except DatabaseException:
+        short = stock_db.calc_difference(delta)
+        if not short:
+            raise
+        print('Not enough in stock:\n')
+        print(short)
+        raise DatabaseException('Nothing issued.')
+    print(f"Issued: {summary['updated']} entries updated, {summary['removed']} used up and removed.")
+
+
 def cmd_clear_stock_db(args):
     stock_db.clear()
     print('Stock database cleared.')
@@ -98,51 +169,273 @@ def cmd_subtract_component(args):
     stock_db.subtract_component(cat_name, component_str)
 
 
+def split_window(cat_name, args):
+    """Take limit=N, offset=N and top=N off the query args unless the
+    category has parameters with such names.
+    """
+    window = {}
+    query_args = []
+    for arg in args:
+        k, _, v = arg.partition('=')
+        if k in ('limit', 'offset', 'top') and v.isdigit() and not stock_db.category_has_param(cat_name, k):
+            window[k] = int(v)
+        else:
+            query_args.append(arg)
+    return window, query_args
+
+
 def cmd_filter_components(args):
     cat_name = args[0]
+    window, query_args = split_window(cat_name, args[1:])
     query = {}
-    for pair in args[1:]:
+    for pair in query_args:
         try:
             k, v = pair.split('=')
-        except ValueError as e:
-            print('Error: Query must look like KEY0=VAL0 KEY1=VAL1 ...')
+        except ValueError:
+            raise CommandException('Query must look like KEY0=VAL0 KEY1=VAL1 ... [limit=N] [offset=N] [top=N]')
+        query[k] = v
+    if window:
+        filtered_cat = stock_db.filter_components_view(cat_name, query, **window)
+    else:
+        filtered_cat = stock_db.filter_components(cat_name, **query)
+    print(filtered_cat)
+
+
+def cmd_query(args):
+    if not args:
+        raise CommandException('Query must look like CATEGORY: PARAM=VALUE AND PARAM>=VALUE AND Name^=PREFIX ...')
+    print(stock_db.query(' '.join(args)))
+
+
+def cmd_search_prefix(args):
+    prefix = args[0]
+    found = stock_db.search_prefix(prefix)
+    if found:
+        print(f'Names starting with {prefix}:\n')
+        print(found)
+    else:
+        print('Nothing found.')
+
+
+def cmd_fuzzy_search(args):
+    limit = 20
+    words = []
+    for arg in args:
+        if arg.startswith('limit=') and arg[6:].isdigit():
+            limit = int(arg[6:])
         else:
-            query[k] = v
-    filtered_cat = stock_db.filter_components(cat_name, **query)
+            words.append(arg)
+    if not words:
+        raise CommandException('Use fz TEXT [limit=N]')
+    matches = stock_db.fuzzy_search(' '.join(words), limit)
+    if not matches:
+        print('Nothing found.')
+        return
+    data = [['Score', 'Category', 'Component', 'Qty']]
+    for score, cat_name, component in matches:
+        data.append([f'{score:.0%}', cat_name, ','.join(component[:-1]), component[-1]])
+    print(tabulate(data, headers='firstrow', tablefmt='fancy_grid'))
+
+
+def cmd_filter_components_dominating(args):
+    cat_name = args[0]
+    query = {}
+    for pair in args[1:]:
+        try:
+            k, v = pair.split('=')
+        except ValueError:
+            raise CommandException('Query must look like KEY0=VAL0 KEY1=VAL1 ...')
+        query[k] = v
+    filtered_cat = stock_db.filter_components_dominating(cat_name, **query)
     print(filtered_cat)
 
 
 def cmd_filter_components_from_bound(args):
     cat_name = args[0]
     query = args[1]
+    window, _ = split_window(cat_name, args[2:])
 
     if '>=' in query:
         operation_str = '>='
     elif '<=' in query:
         operation_str = '<='
     else:
-        print('Error: Query must look like PARAM>=VALUE or PARAM<=VALUE')
-        return
+        raise CommandException('Query must look like PARAM>=VALUE or PARAM<=VALUE')
     param_str, bound_str = query.split(operation_str)
-    filtered_cat = stock_db.filter_components_from_bound(cat_name, param_str, bound_str, operation_str)
+    if window:
+        filtered_cat = stock_db.filter_components_from_bound_view(
+            cat_name, param_str, bound_str, operation_str, **window)
+    else:
+        filtered_cat = stock_db.filter_components_from_bound(cat_name, param_str, bound_str, operation_str)
     print(filtered_cat)
 
 
+def cmd_filter_all(args):
+    query = {}
+    for pair in args:
+        k, _, v = pair.partition('=')
+        if not k or not _:
+            raise CommandException('Query must look like KEY0=VAL0 KEY1=VAL1 ...')
+        query[k] = v
+    found = stock_db.filter_all(**query)
+    if found:
+        print(found)
+    else:
+        print('Nothing found.')
+
+
+def cmd_filter_all_from_bound(args):
+    query = args[0]
+    if '>=' in query:
+        operation_str = '>='
+    elif '<=' in query:
+        operation_str = '<='
+    else:
+        raise CommandException('Query must look like PARAM>=VALUE or PARAM<=VALUE')
+    param_str, bound_str = query.split(operation_str)
+    found = stock_db.filter_all_from_bound(param_str, bound_str, operation_str)
+    if found:
+        print(found)
+    else:
+        print('Nothing found.')
+
+
+def print_substitutes(k=3, series=None):
+    substitutes = stock_db.find_substitutes(not_in_stock_db, k, series)
+    if not substitutes:
+        return False
+    data = [['Category', 'Not in stock', 'Substitutes in stock']]
+    for cat_name, component, candidates in substitutes:
+        data.append([cat_name, ','.join(map(str, component)),
+                     '\n'.join(','.join(map(str, c)) for c in candidates)])
+    print('Possible substitutes:')
+    print(tabulate(data, headers='firstrow', tablefmt='fancy_grid'))
+    return True
+
+
 def cmd_print_difference(args):
     global not_in_stock_db
-    not_in_stock_db = stock_db.calc_difference(project_db)
+    if shortage is not None:
+        not_in_stock_db = shortage.result()
+    else:
+        not_in_stock_db = stock_db.calc_difference(project_db)
     if not_in_stock_db:
         print('Not in stock:')
         print(not_in_stock_db)
+        print_substitutes()
     else:
         print('All components are in stock.')
 
 
+def cmd_print_substitutes(args):
+    if not_in_stock_db is None:
+        raise CommandException('Run pd first')
+    k, series = 3, None
+    for arg in args:
+        if arg.isdigit():
+            k = int(arg)
+        else:
+            series = arg
+    if not print_substitutes(k, series):
+        print('No substitutes found.')
+
+
+def cmd_kit(args):
+    global not_in_stock_db
+    if not args:
+        raise CommandException('Use kit FILE.csv[:BUILDS] ...')
+    projects = []
+    for arg in args:
+        filename, builds = arg, 1
+        if ':' in arg and arg.rsplit(':', 1)[1].isdigit():
+            filename, builds = arg.rsplit(':', 1)
+            builds = int(builds)
+        project = Database()
+        with open(filename, 'r') as f:
+            project.load_from_csv(f.readlines())
+        # The argument as typed, numbered if repeated, keeps the columns apart
+        taken = [label for label, _, _ in projects]
+        label = arg
+        n = 1
+        while label in taken:
+            n += 1
+            label = f'{arg} #{n}'
+        projects.append((label, project, builds))
+
+    not_in_stock_db, shares = stock_db.calc_kit_shortage(projects)
+    if not not_in_stock_db:
+        print('All components for the kit are in stock.')
+        return
+    print('Not in stock for the kit:')
+    print(not_in_stock_db)
+    labels = [label for label, project, builds in projects]
+    data = [['Category', 'Component', 'In stock', 'Needed', 'Short'] + labels]
+    for cat_name, component, in_stock, total, demand in shares:
+        data.append([cat_name, ','.join(component[:-1]), in_stock, total, total - in_stock]
+                    + [demand.get(label, 0) for label in labels])
+    print('Shares of the projects:')
+    print(tabulate(data, headers='firstrow', tablefmt='fancy_grid'))
+
+
+def delta_script(delta):
+    """Return the REPL commands turning the older snapshot into the newer one.
+    Adds come first: a category emptied by a sub is deleted, so a later add would fail.
+    """
+    lines = []
+    for cat_name, format_str, added, removed, changed in delta:
+        lines.append(f'# {cat_name}: {len(added)} added, {len(removed)} removed, {len(changed)} changed')
+        subs = list(removed)
+        for component in added:
+            lines.append(f'add {cat_name} {",".join(map(str, component))}')
+        for component, new_component in changed:
+            quantity = new_component[-1] - component[-1]
+            if quantity > 0:
+                lines.append(f'add {cat_name} {",".join(map(str, component[:-1] + [quantity]))}')
+            else:
+                subs.append(component[:-1] + [-quantity])
+        for component in subs:
+            lines.append(f'sub {cat_name} {",".join(map(str, component))}')
+    return lines
+
+
+def cmd_print_delta(args):
+    old = storage.read_snapshot(f"{PATH_TO_DB}/{args[0]}")
+    new = storage.read_snapshot(f"{PATH_TO_DB}/{args[1]}")
+    delta = storage.snapshot_delta(old, new)
+    if not delta:
+        print('No changes.')
+        return
+    data = [['Category', 'Added', 'Removed', 'Changed']]
+    data += [[cat_name, len(added), len(removed), len(changed)]
+             for cat_name, format_str, added, removed, changed in delta]
+    print(tabulate(data, headers='firstrow', tablefmt='fancy_grid'))
+
+    lines = delta_script(delta)
+    new_categories = [(cat_name, format_str) for cat_name, format_str, *_ in delta
+                      if cat_name not in old]
+    lines = [f'add-c {cat_name} {format_str}' for cat_name, format_str in new_categories] + lines
+    if len(args) > 2:
+        with open(f"{PATH_TO_DB}/{args[2]}", 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        print(f'Delta script saved ({len(lines)} lines), replay it with main.py -s {args[2]}')
+    else:
+        print('\n'.join(lines))
+
+
+def cmd_print_max_builds(args):
+    builds, limiting = stock_db.calc_max_builds(project_db)
+    print(f'Stock is enough for {builds} project build(s).')
+    data = [['Category', 'Component', 'In stock', 'Per build', 'Missing for next build']]
+    for cat_name, component, in_stock, missing in limiting:
+        data.append([cat_name, ','.join(component[:-1]), in_stock, component[-1], missing])
+    print('Limited by:')
+    print(tabulate(data, headers='firstrow', tablefmt='fancy_grid'))
+
+
 def cmd_save_difference(args):
     filename = args[0]
     if not_in_stock_db is None:
-        print('Run pd first')
-        return
+        raise CommandException('Run pd first')
     with open(filename, 'w') as f:
         text = not_in_stock_db.convert_to_csv()
         f.write(text)
@@ -161,6 +454,79 @@ def cmd_clear_screen(args):
         os.system('cls')
 
 
+def cmd_stats(args):
+    if not args:
+        if not instrumentation.timings and not instrumentation.counters:
+            print('No statistics collected. Use stats on to enable instrumentation.')
+        else:
+            print(instrumentation.report())
+    elif args[0] == 'on':
+        instrumentation.enabled = True
+        instrumentation.profiling = len(args) > 1 and args[1] == 'profile'
+        print('Instrumentation enabled' + (' with profiling.' if instrumentation.profiling else '.'))
+    elif args[0] == 'off':
+        instrumentation.enabled = False
+        instrumentation.profiling = False
+        print('Instrumentation disabled.')
+    elif args[0] == 'reset':
+        instrumentation.reset()
+        print('Statistics reset.')
+    elif args[0] == 'prof':
+        if len(args) > 1:
+            if instrumentation.dump_profile(args[1]):
+                print(f'Profile of {instrumentation.last_command} saved.')
+            else:
+                print('No profile recorded. Use stats on profile first.')
+        else:
+            report = instrumentation.profile_report()
+            print(report if report is not None else 'No profile recorded. Use stats on profile first.')
+    else:
+        raise CommandException('Use stats [on [profile]|off|reset|prof [FILE]]')
+
+
+def cmd_cache(args):
+    if args and args[0] == 'size' and len(args) > 1 and args[1].isdigit():
+        ComponentCategory.cache_size = int(args[1])
+        print(f'Query cache size set to {ComponentCategory.cache_size} results per category.')
+        return
+    if args:
+        raise CommandException('Use cache [size N]')
+    data = [['Category', 'Cached', 'Hits', 'Misses', 'Hit rate']]
+    for cat_name, size, hits, misses in stock_db.cache_info():
+        rate = f'{hits / (hits + misses):.0%}' if hits + misses else '-'
+        data.append([cat_name, size, hits, misses, rate])
+    print(f'Query cache, up to {ComponentCategory.cache_size} results per category:')
+    print(tabulate(data, headers='firstrow', tablefmt='fancy_grid'))
+
+
+def cmd_undo(args):
+    if history is None:
+        raise CommandException('No undo for a remote stock database')
+    history.undo()
+    print(f'Undone ({len(history)} more step(s) to undo).')
+
+
+def cmd_redo(args):
+    if history is None:
+        raise CommandException('No redo for a remote stock database')
+    history.redo()
+    print(f'Redone ({history.redo_steps} more step(s) to redo).')
+
+
+def cmd_history(args):
+    if history is None:
+        raise CommandException('No history for a remote stock database')
+    if len(args) == 2 and args[0] in ('size', 'rows') and args[1].isdigit():
+        if args[0] == 'size':
+            history.resize(int(args[1]))
+        else:
+            history.resize(history.size, int(args[1]))
+    elif args:
+        raise CommandException('Use hist [size N | rows N]')
+    print(f'{len(history)} step(s) to undo, {history.redo_steps} to redo, up to {history.size} kept.')
+    print(f'{history.rows()} row(s) kept for them, up to {history.max_rows}.')
+
+
 def print_help(args):
     print('Available commands:')
     for cmd in COMMANDS:
@@ -171,8 +537,8 @@ def print_help(args):
 COMMANDS = {
     'q': ((lambda args: quit(0)), 'Quit'),
     '?': (print_help, 'Print this'),
-    'lds':  (cmd_load_stock_db, 'Load stock database from FILE.csv (append)'),
-    'ss':   (cmd_save_stock_db, 'Save stock database to FILE.csv'),
+    'lds':  (cmd_load_stock_db, 'Load stock database from FILE.csv ..., globs or directory DIR (append)'),
+    'ss':   (cmd_save_stock_db, 'Save stock database to FILE.csv or directory DIR/'),
     'ps':   (cmd_print_stock_db, 'Print stock database (category NAME or full DB)'),
     'cs':   (cmd_clear_stock_db, 'Clear stock database'),
     'ldp':  (cmd_load_project_db, 'Load project database from FILE.csv (append)'),
@@ -183,38 +549,140 @@ COMMANDS = {
     'add':  (cmd_add_component, 'Add component to category NAME'),
     'sub':  (cmd_subtract_component, 'Subtract component matching PARAMS from category NAME'),
     'sub-p':    (cmd_subtract_project_from_stock, 'Subtract project BOM database from stock database'),
-    'f':    (cmd_filter_components, 'Filter components matching QUERY'),
-    'fb':   (cmd_filter_components_from_bound, 'Filter components with PARAM >= or <= VALUE'),
+    'rcv':  (cmd_receive, 'Add all components of delta FILE.csv to stock in one step'),
+    'iss':  (cmd_issue, 'Subtract all components of delta FILE.csv from stock, nothing if any is short'),
+    'f':    (cmd_filter_components, 'Filter components matching QUERY [limit=N] [offset=N] [top=N]'),
+    'fb':   (cmd_filter_components_from_bound, 'Filter components with PARAM >= or <= VALUE [limit=N] [offset=N] [top=N]'),
+    'fa':   (cmd_filter_all, 'Filter components matching QUERY in all categories having its params'),
+    'fba':  (cmd_filter_all_from_bound, 'Filter components with PARAM >= or <= VALUE in all categories having PARAM'),
+    'fq':   (cmd_query, 'Filter by QUERY like Resistors: Package=0603 AND Value>=1k AND Value<=10k'),
+    'fn':   (cmd_search_prefix, 'Find components with Name starting with PREFIX in all categories'),
+    'fz':   (cmd_fuzzy_search, 'Fuzzy search TEXT in all categories [limit=N]'),
+    'dom':  (cmd_filter_components_dominating, 'Filter components replacing Value=V Package=P RATING=R ...'),
     'pd':   (cmd_print_difference, 'Print difference between stock and project databases'),
+    'sb':   (cmd_print_substitutes, 'Print K nearest-value substitutes for the difference (sb [K] [E12])'),
     'sd':   (cmd_save_difference, 'Save difference to FILE.csv'),
+    'mb':   (cmd_print_max_builds, 'Print how many project builds the stock supports and what limits it'),
+    'dlt':  (cmd_print_delta, 'Print changes from stock snapshot OLD.csv to NEW.csv as a script [saved to FILE]'),
+    'kit':  (cmd_kit, 'Print combined shortage of project FILE.csv[:BUILDS] ... (saved by sd)'),
     'v':    (cmd_print_all_variants_of_param, 'Print all variants of parameter PARAM in category NAME'),
-    'cl':   (cmd_clear_screen, 'Clear screen')
+    'cache':    (cmd_cache, 'Print query cache statistics (size N sets the cache size)'),
+    'undo': (cmd_undo, 'Undo the last change of the stock database'),
+    'redo': (cmd_redo, 'Redo the last undone change of the stock database'),
+    'hist': (cmd_history, 'Print undo history depth (size N sets how many steps are kept, rows N how many rows)'),
+    'cl':   (cmd_clear_screen, 'Clear screen'),
+    'stats':    (cmd_stats, 'Print command timings and counters (on [profile]|off|reset|prof [FILE])')
 }
 
+# Commands changing the stock database, each one an undo step
+UNDOABLE = {'lds', 'cs', 'add-c', 'add', 'sub', 'sub-p', 'rcv', 'iss'}
+
+
+def execute(line):
+    """Run one command line through COMMANDS. Return False if it failed."""
+    command = line.strip()
+    args = []
+    if ' ' in command:
+        words = command.split(' ')
+        command, args = words[0], words[1:]
+
+    if not command:
+        return True
+    if command not in COMMANDS:
+        print(f'Error: No such command {command}')
+        return False
+
+    callback = COMMANDS[command][0]
+    if history is not None and command in UNDOABLE:
+        history.checkpoint()
+    try:
+        if callback is cmd_stats:  # Keep the statistics of the inspected command
+            callback(args)
+        else:
+            instrumentation.run(command, callback, args)
+    except (CategoryException, DatabaseException) as e:
+        print(e)
+    except CommandException as e:
+        print(f'Error: {e}')
+    except ValueError as e:
+        print(f'Error: {e}')  # Mostly a quantity or number that is not one
+    except FileNotFoundError as e:
+        print(e)
+    except IndexError as e:
+        print(f'{e} => Maybe not enough arguments?')
+    else:
+        return True
+    finally:
+        if history is not None and command in UNDOABLE:
+            history.commit()  # Also a failed command, it may have changed something
+    return False
+
+
+def run_script(lines, source, keep_going=False):
+    """Run command lines non-interactively. Blank lines and lines starting
+    with # are skipped, q stops the script.
+    Return the exit status: 0 if every command succeeded, 1 otherwise.
+    """
+    lines = list(lines)
+    if history is not None and not any(line.split()[:1] in (['undo'], ['redo'], ['hist']) for line in lines):
+        history.resize(0)  # Nothing to undo for, and every step would copy a category
+    status = 0
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line == 'q':
+            break
+        print(f'> {line}')
+        if not execute(line):
+            print(f'{source}:{lineno}: command failed: {line}', file=sys.stderr)
+            status = 1
+            if not keep_going:
+                break
+    return status
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__copyright__)
+    parser.add_argument('-s', '--script', metavar='FILE',
+                        help='run commands from FILE (- for stdin) instead of the interactive prompt')
+    parser.add_argument('-k', '--keep-going', action='store_true',
+                        help='in script mode, continue after a failed command (default: stop)')
+    parser.add_argument('--connect', nargs='?', const='', metavar='SOCKET',
+                        help='use the stock database of a running server.py instead of a local one')
+    parser.add_argument('--stats', action='store_true', help='record command timings and counters')
+    parser.add_argument('--profile', action='store_true', help='also keep a cProfile report of the last command')
+    options = parser.parse_args()
+    instrumentation.enabled = options.stats or options.profile
+    instrumentation.profiling = options.profile
+
+    if options.connect is not None:
+        import server  # Unix sockets only, so not needed for a local session
+        try:
+            stock_db = server.RemoteDatabase(options.connect or server.DEFAULT_SOCKET)
+        except DatabaseException as e:
+            print(e, file=sys.stderr)
+            sys.exit(2)
+        shortage.close()
+        shortage = None
+        history = None  # Other clients change the stock behind our back
+
+    if options.script is None and not sys.stdin.isatty():
+        options.script = '-'
+    if options.script == '-':
+        sys.exit(run_script(sys.stdin, '<stdin>', options.keep_going))
+    if options.script is not None:
+        try:
+            with open(options.script, 'r') as f:
+                lines = f.readlines()
+        except OSError as e:
+            print(e, file=sys.stderr)
+            sys.exit(2)
+        sys.exit(run_script(lines, options.script, options.keep_going))
+
     print(__copyright__)
     print(f'by {__author__}')
     print(f'Version: {__version__}')
 
     while True:
-        command = input('> ').strip()
-        args = []
-        if ' ' in command:
-            words = command.split(' ')
-            command, args = words[0], words[1:]
-
-        if not command:
-            continue
-        if command not in COMMANDS:
-            print(f'Error: No such command {command}')
-            continue
-
-        callback = COMMANDS[command][0]
-        try:
-            callback(args)
-        except (CategoryException, DatabaseException) as e:
-            print(e)
-        except FileNotFoundError as e:
-            print(e)
-        except IndexError as e:
-            print(f'{e} => Maybe not enough arguments?')
+        execute(input('> '))
@@ -0,0 +1,267 @@
+import gc
+import re
+import sys
+from contextlib import contextmanager
+from types import MappingProxyType
+from thirdparty import kicad_netlist_reader
+
+
+class NetlistException(Exception):
+    pass
+
+
+# KiCad writes the XML and the S-expression netlists from the same node tree:
+# XML attributes become `(attr "value")` lists placed before the children.
+# They are indistinguishable from single-valued child elements in the
+# S-expression, so the attribute names are listed per parent element.
+SEXPR_ATTRIBUTES = {
+    'export': ('version',),
+    'sheet': ('number', 'name', 'tstamps'),
+    'comment': ('number', 'value'),
+    'textvar': ('name',),
+    'comp': ('ref',),
+    'field': ('name',),
+    'libsource': ('lib', 'part', 'description'),
+    'property': ('name', 'value'),
+    'sheetpath': ('names', 'tstamps'),
+    'libpart': ('lib', 'part'),
+    'pin': ('num', 'name', 'type'),
+    'unit': ('name',),
+    'library': ('logical',),
+    'net': ('code', 'name', 'class'),
+    'node': ('ref', 'pin', 'pinfunction', 'pintype'),
+}
+
+_STRING = r'"[^"\\]*(?:\\.[^"\\]*)*"|[^\s()"]+'
+_TOKEN_RE = re.compile(
+    rf'\s*(?:\(([^\s()"]+)\s+({_STRING})\)'  # (name value)
+    rf'|\(([^\s()"]+)'  # (name
+    r'|(\))'
+    rf'|({_STRING}))')
+_ESCAPE_RE = re.compile(r'\\(.)', re.DOTALL)
+_UNESCAPE = {'n': '\n', 't': '\t'}
+_REGISTERED = ('comp', 'libpart', 'net', 'library', 'design')
+
+
+def _unquote(token):
+    token = token[1:-1]
+    if '\\' in token:
+        token = _ESCAPE_RE.sub(lambda m: _UNESCAPE.get(m.group(1), m.group(1)), token)
+    return token
+
+
+@contextmanager
+def _gc_paused():
+    # A netlist tree is hundreds of thousands of small objects that all
+    # survive the load, so cyclic GC passes while building it are wasted.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _quote(text):
+    text = text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'"{text}"'
+
+
+_NO_ATTRIBUTES = MappingProxyType({})
+
+
+class compactElement:
+    """Memory-compact replacement for `xmlElement`.
+    No instance `__dict__`, tag and attribute names are interned and the
+    attribute dict and child list are only allocated when first needed.
+    """
+    __slots__ = ('name', 'parent', 'chars', '_attributes', '_children')
+
+    def __init__(self, name, parent=None):
+        self.name = sys.intern(name)
+        self.parent = parent
+        self.chars = ''
+        self._attributes = None
+        self._children = None
+
+    @property
+    def attributes(self):
+        return self._attributes if self._attributes is not None else _NO_ATTRIBUTES
+
+    @property
+    def children(self):
+        return self._children if self._children is not None else ()
+
+    def addAttribute(self, attr, value):
+        """Add an attribute to this element"""
+        if self._attributes is None:
+            self._attributes = {}
+        self._attributes[sys.intern(attr)] = value
+
+    setAttribute = addAttribute
+
+    def setChars(self, chars):
+        """Set the characters for this element"""
+        self.chars = chars
+
+    def addChars(self, chars):
+        """Add characters (textual value) to this element"""
+        self.chars += chars
+
+    def addChild(self, child):
+        """Add a child element to this element"""
+        if self._children is None:
+            self._children = [child]
+        else:
+            self._children.append(child)
+        return child
+
+    # Read-only accessors only go through the public attributes above.
+    __str__ = kicad_netlist_reader.xmlElement.__str__
+    formatXML = kicad_netlist_reader.xmlElement.formatXML
+    formatHTML = kicad_netlist_reader.xmlElement.formatHTML
+    getParent = kicad_netlist_reader.xmlElement.getParent
+    getChild = kicad_netlist_reader.xmlElement.getChild
+    getChildren = kicad_netlist_reader.xmlElement.getChildren
+    get = kicad_netlist_reader.xmlElement.get
+
+
+class _TreeBuilder:
+    """Element tree construction shared by the netlist readers below."""
+    element_class = compactElement
+
+    def addElement(self, name):
+        """Add a new kicad generic element to the list"""
+        element = self.element_class(name, self._curr_element)
+        if self._curr_element is None:
+            self.tree = element
+        else:
+            self._curr_element.addChild(element)
+        self._curr_element = element
+        if name in _REGISTERED:
+            self._register(element)
+        return element
+
+    def _register(self, element):
+        """Same bookkeeping as netlist.addElement for the new element."""
+        name = element.name
+        if name == 'comp':
+            self.components.append(kicad_netlist_reader.comp(element))
+        elif name == 'libpart':
+            self.libparts.append(kicad_netlist_reader.libpart(element))
+        elif name == 'net':
+            self.nets.append(element)
+        elif name == 'library':
+            self.libraries.append(element)
+        elif name == 'design':
+            self.design = element
+
+
+class CompactNetlist(_TreeBuilder, kicad_netlist_reader.netlist):
+    """KiCad XML netlist read by the SAX reader into compact elements."""
+
+    def load(self, fname):
+        with _gc_paused():
+            super().load(fname)
+
+
+class SexprNetlist(_TreeBuilder, kicad_netlist_reader.netlist):
+    """KiCad netlist loaded from the native `.net` S-expression format.
+    Builds the same element tree as the XML reader, so `comp` and `libpart`
+    accessors work unchanged.
+    """
+
+    def __init__(self, fname='', compact=True):
+        if not compact:
+            self.element_class = kicad_netlist_reader.xmlElement
+        super().__init__(fname)
+
+    def load(self, fname):
+        with open(fname, 'r', encoding='utf-8') as f:
+            text = f.read()
+        with _gc_paused():
+            self.parse(text)
+
+    def parse(self, text):
+        element_class = self.element_class
+        attributes = SEXPR_ATTRIBUTES
+        registered = _REGISTERED
+        curr = self._curr_element
+        curr_attributes = ()
+        stack = []
+        for match in _TOKEN_RE.finditer(text):
+            leaf_name, leaf_value, name, close, atom = match.groups()
+            if leaf_name:
+                # `(name value)` is either an attribute of the current element
+                # or a child element holding just characters.
+                if curr is None:
+                    raise NetlistException(f'Unexpected ({leaf_name} {leaf_value}) outside of netlist')
+                if leaf_value[0] == '"':
+                    leaf_value = _unquote(leaf_value)
+                if leaf_name in curr_attributes:
+                    curr.setAttribute(leaf_name, leaf_value)
+                else:
+                    child = curr.addChild(element_class(leaf_name, curr))
+                    child.chars = leaf_value
+                    if leaf_name in registered:
+                        self._register(child)
+            elif name:
+                if curr is None:
+                    curr = self.tree = element_class(name)
+                else:
+                    stack.append(curr_attributes)
+                    curr = curr.addChild(element_class(name, curr))
+                curr_attributes = attributes.get(name, ())
+                if name in registered:
+                    self._register(curr)
+            elif close:
+                if curr is None:
+                    raise NetlistException('Unbalanced ")" in netlist')
+                curr = curr.parent
+                if stack:
+                    curr_attributes = stack.pop()
+            else:
+                if curr is None:
+                    raise NetlistException(f'Unexpected {atom} outside of netlist')
+                curr.chars += _unquote(atom) if atom[0] == '"' else atom
+
+        if curr is not None or not self.tree:
+            raise NetlistException('Unexpected end of netlist')
+        self._curr_element = None
+        self.endDocument()
+
+
+def format_sexpr(element, nestLevel=0):
+    """Return the element tree formatted as a KiCad S-expression netlist."""
+    indent = '  ' * nestLevel
+    s = indent + '(' + element.name
+    for a in element.attributes:
+        s += f' ({a} {_quote(element.attributes[a])})'
+    if element.chars:
+        s += ' ' + _quote(element.chars)
+    for c in element.children:
+        s += '\n' + format_sexpr(c, nestLevel + 1)
+    return s + ')'
+
+
+def detect_format(fname):
+    """Return 'xml' or 'sexpr' judging by the first character of the file."""
+    with open(fname, 'r', encoding='utf-8') as f:
+        head = f.read(256).lstrip('\ufeff \t\r\n')
+    if head.startswith('<'):
+        return 'xml'
+    if head.startswith('('):
+        return 'sexpr'
+    raise NetlistException(f'Unknown netlist format: {fname}')
+
+
+def read_netlist(fname, compact=True):
+    """Load a KiCad netlist in either XML or S-expression format.
+    With compact=False the tree is built from the original `xmlElement`.
+    """
+    if detect_format(fname) == 'sexpr':
+        return SexprNetlist(fname, compact)
+    if compact:
+        return CompactNetlist(fname)
+    return kicad_netlist_reader.netlist(fname)
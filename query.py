@@ -0,0 +1,36 @@
+"""Query expressions over one category, e.g.
+
+    Resistors: Package=0603 AND Value>=1k AND Value<=10k
+    ICs: Name^=STM32F4 AND Qty>=10
+
+Operators: = (numeric parameters compare by value), ^= (prefix),
+>=, <=, > and < (numeric). Qty refers to the quantity, the last column
+whatever its name.
+"""
+import re
+from collections import namedtuple
+from category import CategoryException
+
+Condition = namedtuple('Condition', 'param op value')
+
+OPERATORS = ('^=', '>=', '<=', '=', '>', '<')
+
+_AND_RE = re.compile(r'\s+AND\s+', re.IGNORECASE)
+_CONDITION_RE = re.compile(r'([^\s<>=^]+)\s*(\^=|>=|<=|=|>|<)\s*(\S.*)')
+
+
+def parse(text):
+    """Return (category name, list of Condition) of a query expression."""
+    cat_name, colon, conditions_str = text.partition(':')
+    cat_name = cat_name.strip()
+    if not colon or not cat_name:
+        raise CategoryException(f'Query must look like CATEGORY: PARAM=VALUE AND ...: {text}')
+    conditions = []
+    conditions_str = conditions_str.strip()
+    if conditions_str:
+        for condition_str in _AND_RE.split(conditions_str):
+            match = _CONDITION_RE.fullmatch(condition_str.strip())
+            if match is None:
+                raise CategoryException(f'Bad condition: {condition_str}')
+            conditions.append(Condition(*(group.strip() for group in match.groups())))
+    return cat_name, conditions
@@ -0,0 +1,89 @@
+import threading
+from contextlib import contextmanager
+
+
+class RWLock:
+    """Reader-writer lock: any number of readers or a single writer.
+    Waiting writers block new readers and the readers that waited get their
+    turn before the next writer, so neither side can starve the other.
+    Both sides are reentrant and the writer may also read; taking the write
+    lock while holding only a read lock is an error.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._waiting_writers = 0
+        self._waiting_readers = 0
+        self._readers_turn = False
+        self._local = threading.local()
+
+    def _read_depth(self):
+        return getattr(self._local, 'depth', 0)
+
+    def acquire_read(self):
+        depth = self._read_depth()
+        if depth or self._writer == threading.get_ident():
+            self._local.depth = depth + 1
+            return
+        with self._cond:
+            self._waiting_readers += 1
+            while self._writer is not None or (self._waiting_writers and not self._readers_turn):
+                self._cond.wait()
+            self._waiting_readers -= 1
+            if not self._waiting_readers:
+                self._readers_turn = False
+            self._readers += 1
+        self._local.depth = 1
+
+    def release_read(self):
+        depth = self._read_depth() - 1
+        self._local.depth = depth
+        if depth or self._writer == threading.get_ident():
+            return
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            self._write_depth += 1
+            return
+        if self._read_depth():
+            raise RuntimeError('Cannot upgrade a read lock to a write lock')
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer is not None or self._readers or self._readers_turn:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = me
+            self._write_depth = 1
+
+    def release_write(self):
+        self._write_depth -= 1
+        if self._write_depth:
+            return
+        with self._cond:
+            self._writer = None
+            self._readers_turn = self._waiting_readers > 0
+            self._cond.notify_all()
+
+    @contextmanager
+    def reading(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def writing(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -0,0 +1,288 @@
+"""Resident stock database served over a local Unix-domain socket.
+
+Run the server once:
+    python server.py [--socket PATH] [FILE.csv ...]
+and start the REPL as a thin client with `python main.py --connect [PATH]`.
+
+Requests and responses are single JSON lines. Databases travel as the same
+CSV text `convert_to_csv()` produces, categories as name/format/rows.
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+from category import ComponentCategory, CategoryException
+from database import Database, DatabaseException
+
+PATH_TO_DB = os.path.dirname(os.path.realpath(__file__))
+DEFAULT_SOCKET = os.path.join(PATH_TO_DB, '.dxstock.sock')
+
+_EXCEPTIONS = {
+    'CategoryException': CategoryException,
+    'DatabaseException': DatabaseException,
+}
+
+
+def _db_from_csv(text):
+    db = Database()
+    db.load_from_csv([line for line in text.splitlines() if line])
+    return db
+
+
+def _category_to_json(category):
+    return {'name': category.name, 'format': category.format_str, 'components': list(category.components)}
+
+
+def _category_from_json(data):
+    return ComponentCategory(data['name'], data['format'], data['components'])
+
+
+def _kit_to_json(ns_db, shares):
+    return ns_db.convert_to_csv(), shares
+
+
+_METHODS = {
+    'add_category': lambda db, name, fmt: db.add_category(name, fmt),
+    'add_component': lambda db, name, c: db.add_component(name, c),
+    'subtract_component': lambda db, name, c: db.subtract_component(name, c),
+    'subtract_other': lambda db, other: db.subtract_other(_db_from_csv(other)),
+    'merge': lambda db, other, sign: db.merge(_db_from_csv(other), sign),
+    'load_from_csv': lambda db, lines: db.load_from_csv(lines),
+    'clear': lambda db: db.clear(),
+    'filter_components': (
+        lambda db, name, query: _category_to_json(db.filter_components(name, **query))),
+    'filter_components_from_bound': (
+        lambda db, *args: _category_to_json(db.filter_components_from_bound(*args))),
+    'fuzzy_search': lambda db, text, limit, threshold: db.fuzzy_search(text, limit, threshold),
+    'search_prefix': lambda db, prefix: db.search_prefix(prefix).convert_to_csv(),
+    'filter_all': lambda db, query: db.filter_all(**query).convert_to_csv(),
+    'filter_all_from_bound': lambda db, *args: db.filter_all_from_bound(*args).convert_to_csv(),
+    'query': lambda db, query_str: _category_to_json(db.query(query_str)),
+    'filter_components_view': (
+        lambda db, name, query, *window: _category_to_json(db.filter_components_view(name, query, *window))),
+    'filter_components_from_bound_view': (
+        lambda db, *args: _category_to_json(db.filter_components_from_bound_view(*args))),
+    'filter_components_dominating': (
+        lambda db, name, query: _category_to_json(db.filter_components_dominating(name, **query))),
+    'calc_difference': lambda db, other: db.calc_difference(_db_from_csv(other)).convert_to_csv(),
+    'calc_kit_shortage': lambda db, projects: _kit_to_json(
+        *db.calc_kit_shortage([(label, _db_from_csv(csv), builds) for label, csv, builds in projects])),
+    'calc_max_builds': lambda db, other: db.calc_max_builds(_db_from_csv(other)),
+    'find_substitutes': lambda db, other, k, series: db.find_substitutes(_db_from_csv(other), k, series),
+    'convert_to_csv': lambda db: db.convert_to_csv(),
+    'str': lambda db: str(db),
+    'bool': lambda db: bool(db),
+    'category_to_str': lambda db, name: db.category_to_str(name),
+    'cache_info': lambda db: db.cache_info(),
+    'get_category_format': lambda db, name: db.get_category_format(name),
+    'get_all_variants_of_param': lambda db, name, param: db.get_all_variants_of_param(name, param),
+    'category_has_param': lambda db, name, param: db.category_has_param(name, param),
+}
+
+
+class StockServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Keeps one stock Database resident and serves it to any number of clients.
+    The database must be thread-safe: queries from different sessions run
+    in parallel, while every change is applied atomically on its own.
+    """
+    daemon_threads = True
+
+    def __init__(self, path, db):
+        self.db = db
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except OSError:
+                os.unlink(path)  # Left over from a server that did not shut down
+            else:
+                raise DatabaseException(f'Stock server already running at {path}')
+            finally:
+                probe.close()
+        super().__init__(path, _RequestHandler)
+
+    def call(self, method, args):
+        if method not in _METHODS:
+            raise DatabaseException(f'Unsupported request: {method}')
+        return _METHODS[method](self.db, *args)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                result = self.server.call(request['method'], request.get('args', []))
+                response = {'ok': True, 'result': result}
+            except (CategoryException, DatabaseException) as e:
+                response = {'ok': False, 'type': type(e).__name__, 'error': str(e)}
+            except (ValueError, KeyError, TypeError, IndexError) as e:
+                response = {'ok': False, 'type': 'DatabaseException', 'error': f'Bad request: {e}'}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class RemoteDatabase:
+    """Client side of StockServer with the Database interface main.py uses."""
+
+    def __init__(self, path=DEFAULT_SOCKET):
+        self.path = path
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._sock.connect(path)
+        except OSError as e:
+            raise DatabaseException(f'Cannot connect to stock server at {path}: {e}')
+        self._file = self._sock.makefile('rwb')
+
+    def _call(self, method, *args):
+        try:
+            self._file.write(json.dumps({'method': method, 'args': args}).encode('utf-8') + b'\n')
+            self._file.flush()
+            line = self._file.readline()
+        except OSError as e:
+            raise DatabaseException(f'Stock server: {e}')
+        if not line:
+            raise DatabaseException('Stock server closed the connection')
+        response = json.loads(line)
+        if not response['ok']:
+            raise _EXCEPTIONS.get(response['type'], DatabaseException)(response['error'])
+        return response['result']
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+    def __getattr__(self, name):
+        # Only Database methods the server lacks, not attributes like categories
+        if name.startswith('_') or not callable(getattr(Database, name, None)):
+            raise AttributeError(name)
+
+        def unsupported(*args, **kwargs):
+            raise DatabaseException(f'{name} is not supported by the stock server')
+        return unsupported
+
+    def add_category(self, cat_name, cat_format_str):
+        self._call('add_category', cat_name, cat_format_str)
+
+    def add_component(self, cat_name, component_str):
+        self._call('add_component', cat_name, component_str)
+
+    def subtract_component(self, cat_name, component_str):
+        self._call('subtract_component', cat_name, component_str)
+
+    def filter_components(self, cat_name, **kwargs):
+        return _category_from_json(self._call('filter_components', cat_name, kwargs))
+
+    def filter_components_from_bound(self, cat_name, param_str, bound_str, operation_str):
+        return _category_from_json(
+            self._call('filter_components_from_bound', cat_name, param_str, bound_str, operation_str))
+
+    def fuzzy_search(self, text, limit=20, threshold=0.5):
+        return self._call('fuzzy_search', text, limit, threshold)
+
+    def search_prefix(self, prefix):
+        return _db_from_csv(self._call('search_prefix', prefix))
+
+    def filter_all(self, max_workers=None, **kwargs):
+        return _db_from_csv(self._call('filter_all', kwargs))
+
+    def filter_all_from_bound(self, param_str, bound_str, operation_str, max_workers=None):
+        return _db_from_csv(self._call('filter_all_from_bound', param_str, bound_str, operation_str))
+
+    def query(self, query_str):
+        return _category_from_json(self._call('query', query_str))
+
+    def filter_components_view(self, cat_name, query, limit=None, offset=0, top=None):
+        return _category_from_json(self._call('filter_components_view', cat_name, query, limit, offset, top))
+
+    def filter_components_from_bound_view(self, cat_name, param_str, bound_str, operation_str,
+                                          limit=None, offset=0, top=None):
+        return _category_from_json(self._call('filter_components_from_bound_view', cat_name, param_str,
+                                              bound_str, operation_str, limit, offset, top))
+
+    def filter_components_dominating(self, cat_name, **kwargs):
+        return _category_from_json(self._call('filter_components_dominating', cat_name, kwargs))
+
+    def calc_difference(self, other):
+        return _db_from_csv(self._call('calc_difference', other.convert_to_csv()))
+
+    def subtract_other(self, other):
+        self._call('subtract_other', other.convert_to_csv())
+
+    def merge(self, other, sign=1):
+        return self._call('merge', other.convert_to_csv(), sign)
+
+    def calc_kit_shortage(self, projects):
+        ns_csv, shares = self._call('calc_kit_shortage', [
+            (label, project.convert_to_csv(), builds) for label, project, builds in projects])
+        return _db_from_csv(ns_csv), shares
+
+    def calc_max_builds(self, project):
+        return self._call('calc_max_builds', project.convert_to_csv())
+
+    def find_substitutes(self, shortage, k=3, series=None):
+        return self._call('find_substitutes', shortage.convert_to_csv(), k, series)
+
+    def load_from_csv(self, lines):
+        self._call('load_from_csv', list(lines))
+
+    def convert_to_csv(self):
+        return self._call('convert_to_csv')
+
+    def clear(self):
+        self._call('clear')
+
+    def __str__(self):
+        return self._call('str')
+
+    def __bool__(self):
+        return self._call('bool')
+
+    def category_to_str(self, cat_name):
+        return self._call('category_to_str', cat_name)
+
+    def cache_info(self):
+        return self._call('cache_info')
+
+    def get_category_format(self, cat_name):
+        return self._call('get_category_format', cat_name)
+
+    def get_all_variants_of_param(self, cat_name, param_str):
+        return self._call('get_all_variants_of_param', cat_name, param_str)
+
+    def category_has_param(self, cat_name, param_str):
+        return self._call('category_has_param', cat_name, param_str)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='DxStock resident stock server')
+    parser.add_argument('files', nargs='*', metavar='FILE.csv', help='stock database files to load')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help=f'socket path (default: {DEFAULT_SOCKET})')
+    options = parser.parse_args()
+
+    stock_db = Database(thread_safe=True)
+    for filename in options.files:
+        with open(f'{PATH_TO_DB}/{filename}', 'r') as f:
+            stock_db.load_from_csv(f.readlines())
+    try:
+        server = StockServer(options.socket, stock_db)
+    except DatabaseException as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    print(f'Serving stock database on {options.socket}', file=sys.stderr)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
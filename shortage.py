@@ -0,0 +1,85 @@
+from category import CategoryException
+from database import Database
+
+
+class ShortageView:
+    """Difference between a stock and a project database, the same as
+    stock.calc_difference(project), kept current as either of them changes.
+    A change of one component updates only its row, so result() costs
+    nothing however big the databases are.
+    """
+
+    def __init__(self, stock, project):
+        self.stock = stock
+        self.project = project
+        self._result = Database()
+        self._errors = {}  # cat_name -> format mismatch
+        stock.add_listener(self._changed)
+        project.add_listener(self._changed)
+        self._update_all()
+
+    def close(self):
+        """Stop following the databases."""
+        self.stock.remove_listener(self._changed)
+        self.project.remove_listener(self._changed)
+
+    def result(self):
+        """Return the current shortage Database. It changes along with the
+        stock and the project, so do not modify it.
+        """
+        if self._errors:
+            raise CategoryException(next(iter(self._errors.values())))
+        return self._result
+
+    def _changed(self, db, cat_name, key):
+        if cat_name is None:
+            self._update_all()
+        elif key is None or cat_name in self._errors:
+            self._update_category(cat_name)
+        else:
+            self._update(cat_name, key)
+
+    def _update_all(self):
+        self._result.clear()
+        self._errors.clear()
+        for cat_name in self.project.categories:
+            self._update_category(cat_name)
+
+    def _update_category(self, cat_name):
+        self._errors.pop(cat_name, None)
+        if cat_name in self._result.categories:
+            del self._result.categories[cat_name]
+            self._result._owned.discard(cat_name)
+        o_cat = self.project.categories.get(cat_name)
+        if o_cat is None:
+            return
+        cat = self.stock.categories.get(cat_name)
+        if cat is not None and cat.format != o_cat.format:
+            self._errors[cat_name] = (f'Format mismatch: {o_cat.name}:{o_cat.format_str} '
+                                      f'<> {cat.name}:{cat.format_str}')
+            return
+        for o_component in o_cat.components:
+            self._update(cat_name, o_cat._key(o_component))
+
+    def _update(self, cat_name, key):
+        """Bring the shortage of one component up to date."""
+        cat = self.stock.categories.get(cat_name)
+        o_cat = self.project.categories.get(cat_name)
+        o_component = o_cat.find_key(key) if o_cat is not None else None
+        component = cat.find_key(key) if cat is not None else None
+        needed = o_component[-1] if o_component is not None else 0
+        in_stock = component[-1] if component is not None else 0
+        quantity = max(needed - in_stock, 0)
+
+        ns_cat = self._result.categories.get(cat_name)
+        ns_component = ns_cat.find_key(key) if ns_cat is not None else None
+        current = ns_component[-1] if ns_component is not None else 0
+        if quantity == current:
+            return
+        if quantity > current:
+            if ns_cat is None:
+                self._result.add_category(cat_name, o_cat.format_str)
+            params = (component if component is not None else o_component)[:-1]
+            self._result.add_component(cat_name, ','.join(params + [str(quantity - current)]))
+        else:
+            self._result.subtract_component(cat_name, ','.join(ns_component[:-1] + [str(current - quantity)]))
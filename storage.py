@@ -0,0 +1,329 @@
+"""Stock database stored as a directory with one CSV file per category.
+
+    DIR/manifest.json       category names, formats and file names
+    DIR/<category>.csv      the category as convert_to_csv() writes it
+
+Categories are read on first access, and a save rewrites only the
+categories changed since they were loaded or last saved.
+"""
+import json
+import os
+import re
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from category import ComponentCategory, CategoryException
+from database import Database, DatabaseException
+
+MANIFEST = 'manifest.json'
+
+
+class _Unloaded:
+    """Placeholder of a category not read from its file yet. Snapshots (of
+    the undo history, say) share it, so before the file is overwritten the
+    store pins it: reads the contents it stands for to keep them.
+    """
+
+    def __init__(self, store, name, format_str):
+        self.store = store
+        self.name = name
+        self.format_str = format_str
+        self.pinned = None  # The category once the file has changed under us
+
+    def load(self):
+        if self.pinned is not None:
+            return self.pinned
+        return self.store.load_category(self.name, self.format_str)
+
+    def pin(self):
+        if self.pinned is None:
+            self.pinned = self.store.read_category(self.name, self.format_str)
+
+
+class LazyCategories(dict):
+    """Categories of a Database, some of them possibly not loaded yet.
+    Looking a category up loads it; iterating names and `in` do not.
+    """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._load_lock = threading.Lock()
+
+    def __getitem__(self, cat_name):
+        category = super().__getitem__(cat_name)
+        if isinstance(category, _Unloaded):
+            with self._load_lock:
+                category = super().__getitem__(cat_name)
+                if isinstance(category, _Unloaded):
+                    category = category.load()
+                    super().__setitem__(cat_name, category)
+        return category
+
+    def get(self, cat_name, default=None):
+        return self[cat_name] if cat_name in self else default
+
+    def values(self):
+        return [self[cat_name] for cat_name in self]
+
+    def items(self):
+        return [(cat_name, self[cat_name]) for cat_name in self]
+
+    def copy(self):
+        """Return a copy sharing the placeholders, so nothing is loaded."""
+        return LazyCategories(dict.items(self))
+
+    def placeholder(self, cat_name):
+        category = super().__getitem__(cat_name)
+        return category if isinstance(category, _Unloaded) else None
+
+
+def _check_local(db):
+    if not isinstance(db, Database):
+        raise DatabaseException('Directory databases work only with a local stock, not a server')
+
+
+def _file_name(cat_name, taken):
+    base = re.sub(r'[^\w.-]', '_', cat_name) or 'category'
+    name = f'{base}.csv'
+    n = 1
+    while name in taken:
+        n += 1
+        name = f'{base}_{n}.csv'
+    return name
+
+
+class DirectoryStore:
+    """A stock database directory. Remembers which generation of every
+    category it has on disk to skip unchanged ones when saving.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._files = {}  # cat_name -> file name
+        self._saved = {}  # cat_name -> generation of the category on disk
+        self._placeholders = {}  # cat_name -> placeholders of the file still around
+
+    def _read_manifest(self):
+        manifest_path = os.path.join(self.path, MANIFEST)
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+            return [(c['name'], c['format'], c['file']) for c in manifest['categories']]
+        except (ValueError, KeyError, TypeError) as e:
+            raise DatabaseException(f'Bad manifest {manifest_path}: {e}')
+
+    def load(self, db):
+        """Add the categories of the directory to db. New categories are
+        only read when first used, existing ones are merged right away.
+        """
+        _check_local(db)
+        entries = self._read_manifest()
+        with db._lock.writing() if db._lock is not None else nullcontext():
+            if not isinstance(db.categories, LazyCategories):
+                db.categories = LazyCategories(db.categories)
+            for cat_name, format_str, file_name in entries:
+                self._files[cat_name] = file_name
+                if cat_name in db.categories:
+                    with open(os.path.join(self.path, file_name), 'r') as f:
+                        db.load_from_csv(f.readlines())
+                else:
+                    placeholder = _Unloaded(self, cat_name, format_str)
+                    self._placeholders.setdefault(cat_name, weakref.WeakSet()).add(placeholder)
+                    dict.__setitem__(db.categories, cat_name, placeholder)
+                    db._owned.add(cat_name)
+                    if db._listeners:
+                        db._notify(cat_name, None)
+
+    def load_category(self, cat_name, format_str):
+        category = self.read_category(cat_name, format_str)
+        self._saved[cat_name] = category.generation
+        return category
+
+    def read_category(self, cat_name, format_str):
+        category = ComponentCategory(cat_name, format_str)
+        with open(os.path.join(self.path, self._files[cat_name]), 'r') as f:
+            for line in f.readlines()[2:]:
+                line = line.rstrip('\r\n')
+                if line.strip(','):
+                    category.add(line.rstrip(','))
+        return category
+
+    def _pin(self, cat_name):
+        """Keep what the placeholders of cat_name stand for, its file is about to change."""
+        for placeholder in list(self._placeholders.pop(cat_name, ())):
+            placeholder.pin()
+
+    def save(self, db):
+        """Write the categories of db changed since they were loaded or saved,
+        delete the files of the categories db no longer has.
+        Return the number of category files written.
+        """
+        _check_local(db)
+        os.makedirs(self.path, exist_ok=True)
+        with db._lock.reading() if db._lock is not None else nullcontext():
+            return self._save(db.categories)
+
+    def _save(self, categories):
+        lazy = isinstance(categories, LazyCategories)
+        files = {}
+        formats = {}
+        written = 0
+        for cat_name in list(categories):
+            placeholder = categories.placeholder(cat_name) if lazy else None
+            if placeholder is not None and placeholder.store is self and placeholder.pinned is None:
+                files[cat_name] = self._files[cat_name]  # Never loaded, so unchanged
+                formats[cat_name] = placeholder.format_str
+                continue
+            category = categories[cat_name]
+            file_name = self._files.get(cat_name)
+            if file_name is None:
+                file_name = _file_name(cat_name, set(files.values()) | set(self._files.values()))
+            files[cat_name] = file_name
+            formats[cat_name] = category.format_str
+            if self._saved.get(cat_name) != category.generation:
+                self._pin(cat_name)
+                self._write(file_name, category.convert_to_csv())
+                self._saved[cat_name] = category.generation
+                written += 1
+
+        for cat_name, file_name in self._files.items():
+            if cat_name not in files and file_name not in files.values():
+                self._pin(cat_name)
+                os.remove(os.path.join(self.path, file_name))
+                self._saved.pop(cat_name, None)
+        self._files = files
+        manifest = {'categories': [{'name': cat_name, 'format': formats[cat_name], 'file': file_name}
+                                   for cat_name, file_name in files.items()]}
+        self._write(MANIFEST, json.dumps(manifest, indent=1))
+        return written
+
+    def _write(self, file_name, text):
+        # Replace the file only once the new one is complete
+        path = os.path.join(self.path, file_name)
+        with open(path + '.tmp', 'w') as f:
+            f.write(text)
+        os.replace(path + '.tmp', path)
+
+
+def _parse_csv_file(path):
+    """Parse a stock CSV file in a worker process.
+    Return {cat_name: (format, components)}, cheaper to send back than a Database.
+    """
+    db = Database()
+    with open(path, 'r') as f:
+        db.load_from_csv(f.readlines())
+    return {cat_name: (cat.format_str, list(cat.components)) for cat_name, cat in db.categories.items()}
+
+
+def read_csv_files(paths, max_workers=None):
+    """Parse stock CSV files, in parallel processes if there are several.
+    Return a Database per file. Raise if any file fails to parse.
+    """
+    if len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=min(len(paths), max_workers or os.cpu_count() or 1)) as pool:
+            shards = list(pool.map(_parse_csv_file, paths))
+    else:
+        shards = [_parse_csv_file(path) for path in paths]
+    dbs = []
+    for shard in shards:
+        db = Database()
+        for cat_name, (format_str, components) in shard.items():
+            db.categories[cat_name] = ComponentCategory(cat_name, format_str, components)
+            db._owned.add(cat_name)
+        dbs.append(db)
+    return dbs
+
+
+def load_csv_files(db, paths, max_workers=None):
+    """Parse several stock CSV files in parallel processes and merge them
+    into db. Nothing is merged if any file fails to parse.
+    Return the format conflicts as (path, cat_name, format, format in the file).
+    """
+    conflicts = []
+    for path, shard_db in zip(paths, read_csv_files(paths, max_workers)):
+        for cat_name in list(shard_db.categories):
+            format_str = shard_db.categories[cat_name].format_str
+            try:
+                # Through the API, db may be a RemoteDatabase
+                db_format = db.get_category_format(cat_name)
+            except DatabaseException:
+                continue  # A new category
+            if db_format != format_str.split(','):
+                conflicts.append((path, cat_name, ','.join(db_format), format_str))
+                del shard_db.categories[cat_name]
+        db.merge(shard_db)
+    return conflicts
+
+
+def read_snapshot(path):
+    """Read a stock CSV file for snapshot_delta() without building a Database.
+    Return {cat_name: (format, {parameters text: quantity})}, the quantities
+    of repeated rows summed.
+    """
+    categories = {}
+    cat_name = 'NoName'
+    rows = None
+    new_cat = False
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.rstrip('\r\n').rstrip(',')
+            if new_cat:
+                new_cat = False
+                categories.setdefault(cat_name, (line, {}))
+                format_str, rows = categories[cat_name]
+                n_params = format_str.count(',')
+                continue
+            if ',' not in line:
+                cat_name = line
+                new_cat = True
+                continue
+            if rows is None:
+                raise DatabaseException(f'Category {cat_name} does not exist')
+            params, _, quantity = line.strip().rpartition(',')
+            if params.count(',') != n_params - 1:
+                raise CategoryException(f'Incorrect format: {line}, expected: {format_str}')
+            rows[params] = rows.get(params, 0) + int(quantity)
+    return categories
+
+
+def snapshot_delta(old, new):
+    """Changes from snapshot old to snapshot new, both from read_snapshot(),
+    as a list of (cat_name, format, added, removed, changed) of the categories
+    that differ; changed holds (old row, new row) pairs of different quantity.
+    Rows are joined on their text
+    first and only the rows left over on their canonical key, so 4k7 in one
+    snapshot still matches 4.7k in the other.
+    """
+    delta = []
+    for cat_name in list(old) + [c for c in new if c not in old]:
+        format_str, old_rows = old.get(cat_name, (None, {}))
+        new_format_str, new_rows = new.get(cat_name, (format_str, {}))
+        if format_str is None:
+            format_str = new_format_str
+        elif new_format_str.split(',') != format_str.split(','):
+            raise DatabaseException(f'Format mismatch: {cat_name}:{new_format_str} <> {cat_name}:{format_str}')
+        removed = {params: q for params, q in old_rows.items() if params not in new_rows}
+        added = {params: q for params, q in new_rows.items() if params not in old_rows}
+        changed = [(params, q, new_rows[params]) for params, q in old_rows.items()
+                   if params in new_rows and new_rows[params] != q]
+        if removed and added:
+            category = ComponentCategory(cat_name, format_str)
+            removed_keys = {category._key(params.split(',') + [q]): params for params, q in removed.items()}
+            for params, q in list(added.items()):
+                old_params = removed_keys.pop(category._key(params.split(',') + [q]), None)
+                if old_params is not None:
+                    del added[params]
+                    old_q = removed.pop(old_params)
+                    if old_q != q:
+                        changed.append((old_params, old_q, q))
+        if added or removed or changed:
+            delta.append((cat_name, new_format_str,
+                          [params.split(',') + [q] for params, q in added.items()],
+                          [params.split(',') + [q] for params, q in removed.items()],
+                          [(params.split(',') + [old_q], params.split(',') + [q]) for params, old_q, q in changed]))
+    return delta
+
+
+def is_directory_db(path):
+    return os.path.isdir(path) or path.endswith(('/', os.sep))
@@ -0,0 +1,92 @@
+"""Trigram index for fuzzy search of components by any of their parameters."""
+import functools
+from collections import Counter, defaultdict
+
+
+@functools.lru_cache(maxsize=65536)
+def _word_trigrams(word):
+    # Packages, manufacturers and values repeat a lot, so most words are cached
+    word = f' {word.lower()} '
+    return frozenset(word[i:i + 3] for i in range(len(word) - 2))
+
+
+def trigrams(text):
+    """Return the set of trigrams of the words of text, ignoring case.
+    Words are padded with a space, so their starts and ends count too.
+    """
+    grams = set()
+    for word in text.split():
+        grams |= _word_trigrams(word)
+    return grams
+
+
+class TrigramIndex:
+    """Maps trigrams to the components containing them.
+    Components are added one by one, so the index can follow the category
+    instead of being rebuilt. Removed components are only marked as such
+    and dropped from the postings once they make up half of the index.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(list)  # trigram -> slots
+        self._rows = []  # slot -> component, None once removed
+        self._slots = {}  # id(component) -> slot
+        self._shared = set()  # Trigrams whose postings are shared with another index
+
+    def copy(self):
+        """Return an index of the same components sharing the postings with
+        this one until either adds to them.
+        """
+        index = TrigramIndex()
+        index._postings.update(self._postings)
+        index._rows = self._rows[:]
+        index._slots = self._slots.copy()
+        index._shared = set(self._postings)
+        self._shared = set(self._postings)
+        return index
+
+    def add(self, component):
+        slot = len(self._rows)
+        self._rows.append(component)
+        self._slots[id(component)] = slot
+        for gram in trigrams(' '.join(component[:-1])):
+            if gram in self._shared:
+                self._shared.discard(gram)
+                self._postings[gram] = self._postings[gram][:]
+            self._postings[gram].append(slot)
+
+    def replace(self, component, new_component):
+        """Put new_component, with the same parameters, in place of component."""
+        slot = self._slots.pop(id(component), None)
+        if slot is not None:
+            self._rows[slot] = new_component
+            self._slots[id(new_component)] = slot
+
+    def remove(self, component):
+        slot = self._slots.pop(id(component), None)
+        if slot is None:
+            return
+        self._rows[slot] = None
+        if len(self._slots) * 2 < len(self._rows):
+            rows = [c for c in self._rows if c is not None]
+            self.__init__()
+            for c in rows:
+                self.add(c)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def search(self, text, threshold=0.5):
+        """Return (score, component) of the components sharing at least
+        threshold of the trigrams of text, score being that share.
+        """
+        grams = trigrams(text)
+        if not grams:
+            return []
+        counts = Counter()
+        for gram in grams:
+            counts.update(self._postings.get(gram, ()))
+        needed = threshold * len(grams)
+        rows = self._rows
+        return [(n / len(grams), rows[slot]) for slot, n in counts.items()
+                if n >= needed and rows[slot] is not None]
@@ -0,0 +1,89 @@
+"""Numeric component values: 4k7, 4.7k, 4700, 4R7, 100n, 0.1uF, 25V, 1%, -5V, 1e3.
+
+The meaning of a prefix depends on what is measured: 'm' is milliohm for a
+resistor but millifarad for a capacitor, so every string is parsed for a
+kind. Capacitance and inductance are in pico units, as the stock always had.
+"""
+import functools
+import re
+
+RESISTANCE = 'resistance'
+CAPACITANCE = 'capacitance'
+INDUCTANCE = 'inductance'
+RATING = 'rating'  # Voltage, Current, Wattage, Tolerance
+LEGACY = 'legacy'  # Value of any other category
+
+_MICRO = {'u': 1e6, 'µ': 1e6, 'μ': 1e6}
+
+# kind -> (prefix multipliers, unit suffixes)
+_KINDS = {
+    RESISTANCE: ({'': 1, 'R': 1, 'E': 1, 'm': 1e-3, 'k': 1e3, 'K': 1e3, 'M': 1e6, 'G': 1e9},
+                 ('ohm', 'Ohm', 'Ω', 'R')),
+    CAPACITANCE: ({'': 1, 'p': 1, 'n': 1e3, **_MICRO, 'm': 1e9}, ('F',)),
+    INDUCTANCE: ({'': 1, 'p': 1, 'n': 1e3, **_MICRO, 'm': 1e9}, ('H',)),
+    RATING: ({'': 1, 'p': 1e-12, 'n': 1e-9, 'u': 1e-6, 'µ': 1e-6, 'μ': 1e-6, 'm': 1e-3,
+              'k': 1e3, 'K': 1e3, 'M': 1e6, 'G': 1e9},
+             ('V', 'A', 'W', '%', 'Hz')),
+    # The original single table: 'm' as in capacitance, plain unit letters
+    LEGACY: ({'': 1, 'R': 1, 'k': 1e3, 'M': 1e6, 'G': 1e9, 'p': 1, 'n': 1e3, **_MICRO, 'm': 1e9},
+             ('V', 'A', 'W', '%')),
+}
+
+_RATING_PARAMS = ('Tolerance', 'Voltage', 'Current', 'Wattage')
+
+# number, letters, digits after an infix prefix (4k7), unit
+_VALUE_RE = re.compile(r'([+-]?(?:\d+\.?\d*|\.\d+))([^\d.\s]*?)(\d*)\s*([^\d.\s]*)')
+# number with an exponent (1e3, -2.2E-6), prefix and unit
+_EXPONENT_RE = re.compile(r'([+-]?(?:\d+\.?\d*|\.\d+)[eE][+-]?\d+)\s*([^\d.\s]*)')
+
+
+def kind_of(cat_name, param_str):
+    """Kind of the values of param_str in category cat_name, None if not numeric."""
+    if param_str in _RATING_PARAMS:
+        return RATING
+    if param_str != 'Value':
+        return None
+    name = cat_name.lower()
+    if 'resist' in name:
+        return RESISTANCE
+    if 'capac' in name:
+        return CAPACITANCE
+    if 'induct' in name:
+        return INDUCTANCE
+    return LEGACY
+
+
+@functools.lru_cache(maxsize=65536)
+def parse(value_str, kind):
+    """Return the value of value_str as a float in the base unit of kind.
+    Raise ValueError if it is not a value of that kind.
+    """
+    prefixes, units = _KINDS[kind]
+    value_str = value_str.strip()
+    match = _VALUE_RE.fullmatch(value_str)
+    if match is not None:
+        number, prefix, fraction, unit = match.groups()
+    if match is None or fraction and prefix not in prefixes:
+        # Not 4k7 but maybe 1e3; 4E7 stays 4.7 ohm, E being a resistance infix
+        match = _EXPONENT_RE.fullmatch(value_str)
+        if match is None:
+            raise ValueError(f'Not a value: {value_str}')
+        number, prefix, fraction, unit = match.group(1), '', '', match.group(2)
+    if fraction:
+        # 4k7: the prefix stands for the decimal point
+        if '.' in number or prefix not in prefixes or prefix == '':
+            raise ValueError(f'Not a value: {value_str}')
+        number = f'{number}.{fraction}'
+    else:
+        prefix, unit = '', prefix + unit
+        for u in units:
+            if unit.endswith(u):
+                unit = unit[:-len(u)]
+                break
+        prefix = unit
+    if prefix not in prefixes:
+        raise ValueError(f'No such units: {value_str}')
+    if fraction and unit and unit not in units:
+        raise ValueError(f'No such units: {value_str}')
+    # Round off the binary noise, so 4.7k and 4700 give the same key
+    return float(f'{float(number) * prefixes[prefix]:.12g}')